@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import numpy as np
+from src.embeddings import get_query_embeddings
+
+_PUNCT = re.compile(r"[^\w\s$%.,-]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    question = _PUNCT.sub(" ", question.lower())
+    question = _SPACES.sub(" ", question).strip()
+    return question.rstrip(" .,")
+
+
+class AnswerCache:
+    # invalidate() bumps the document's generation. A QASystem built for an
+    # older generation may still be answering; its put() is dropped, so an
+    # answer from the replaced index cannot land after the invalidation.
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 similarity_threshold: Optional[float] = None, embeddings=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embeddings = embeddings
+        self.entries = OrderedDict()
+        self.generations = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        if not self.similarity_threshold:
+            return None
+        if self.embeddings is None:
+            self.embeddings = get_query_embeddings()
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry["created_at"] > self.ttl_seconds
+
+    def get(self, document_id: str, question: str, k: int) -> Optional[Dict[str, Any]]:
+        key = (document_id, k, normalize_question(question))
+        now = time.time()
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry["result"], question=question, cached="exact")
+
+        vector = self._embed(question)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            best_key, best_score = None, -1.0
+            for other_key, entry in self.entries.items():
+                if other_key[:2] != key[:2] or entry["vector"] is None or self._expired(entry, now):
+                    continue
+                score = float(np.dot(vector, entry["vector"]))
+                if score > best_score:
+                    best_key, best_score = other_key, score
+
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self.entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return dict(self.entries[best_key]["result"], question=question, cached="semantic",
+                            similarity=round(best_score, 4))
+
+            self.misses += 1
+        return None
+
+    def generation(self, document_id: str) -> int:
+        with self._lock:
+            return self.generations.get(document_id, 0)
+
+    def put(self, document_id: str, question: str, k: int, result: Dict[str, Any], generation: int = 0):
+        key = (document_id, k, normalize_question(question))
+        vector = self._embed(question)
+
+        with self._lock:
+            if generation != self.generations.get(document_id, 0):
+                self.stale_puts += 1
+                return
+            self.entries[key] = {"result": dict(result), "vector": vector, "created_at": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, document_id: str) -> int:
+        with self._lock:
+            self.generations[document_id] = self.generations.get(document_id, 0) + 1
+            stale = [key for key in self.entries if key[0] == document_id]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_puts": self.stale_puts
+        }
@@ -1,108 +1,209 @@
 import gradio as gr
 import requests
+from requests.adapters import HTTPAdapter
+import json
+import logging
 import os
+import time
+from src.logger import configure, get_logger, log_event, new_request_id, reset_request_id, set_request_id
 
-API_URL = "http://127.0.0.1:8000"
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+JOB_POLL_INTERVAL = 1.0
+JOB_TIMEOUT = 600
+CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "120"))
 
+configure("ui")
+logger = get_logger("ui")
 
-def upload_file(file):
+
+def create_session():
+    # One keep-alive connection pool for every call to the backend.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+http = create_session()
+
+
+def api(method, path, **kwargs):
+    # The request id travels to the server, so both logs can be joined on it.
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    request_id = new_request_id()
+    kwargs["headers"] = {**kwargs.get("headers", {}), "X-Request-ID": request_id}
+    token = set_request_id(request_id)
+    try:
+        start = time.perf_counter()
+        response = http.request(method, f"{API_URL}{path}", **kwargs)
+        log_event(logger, "api_call", method=method, path=path, status=response.status_code,
+                  duration_ms=round((time.perf_counter() - start) * 1000, 3))
+        return response
+    finally:
+        reset_request_id(token)
+
+
+def session_id(request: gr.Request) -> str:
+    # Each browser session has its own history; Gradio hashes every page load.
+    return request.session_hash
+
+
+def wait_for_job(job_id):
+    deadline = time.time() + JOB_TIMEOUT
+    while time.time() < deadline:
+        response = api("GET", f"/jobs/{job_id}")
+        job = response.json()
+        if job['status'] in ("done", "failed"):
+            return job
+        time.sleep(JOB_POLL_INTERVAL)
+    return {"status": "failed", "error": "Timed out waiting for ingestion", "progress": {}}
+
+
+def upload_file(file, document_id):
+    # The returned document id is kept in this browser session's state, so
+    # questions go to the session's own upload, not the server's latest one.
     if file is None:
-        return "Please upload a file", ""
+        return "Please upload a file", "", document_id
 
     try:
-        print(f"[UPLOAD] Uploading file: {file.name}")
-        
         with open(file.name, "rb") as f:
             files = {"file": (os.path.basename(file.name), f)}
-            response = requests.post(f"{API_URL}/upload", files=files)
+            response = api("POST", "/upload", files=files)
 
-        if response.status_code == 200:
+        if response.status_code == 202:
             data = response.json()
-            print(f"[UPLOAD] Success: {data['filename']}")
+            log_event(logger, "upload_queued", filename=data['filename'], job_id=data['job_id'])
+            job = wait_for_job(data['job_id'])
+
+            if job['status'] == "failed":
+                log_event(logger, "upload_failed", logging.WARNING, filename=data['filename'], error=job['error'])
+                return f"Error: {job['error']}", "", document_id
+
+            progress = job['progress']
+            log_event(logger, "upload_done", filename=data['filename'], elapsed_s=job['elapsed_s'])
             status = f"Document processed successfully!\n\nFilename: {data['filename']}"
-            info = f"**Status:** {data['status']}\n**Message:** {data['message']}"
-            return status, info
+            info = (f"**Status:** ready\n**Document:** {data['document_id']}\n"
+                    f"**Pages:** {progress['pages_extracted']}\n"
+                    f"**Chunks:** {progress['chunks_embedded']}\n**Time:** {job['elapsed_s']}s")
+            return status, info, data['document_id']
         else:
             error = response.json()['detail']
-            print(f"[UPLOAD] Error: {error}")
-            return f"Error: {error}", ""
+            log_event(logger, "upload_failed", logging.WARNING, error=error)
+            return f"Error: {error}", "", document_id
 
     except Exception as e:
-        print(f"[UPLOAD] Exception: {str(e)}")
-        return f"Error: {str(e)}", ""
+        logger.exception("upload_failed")
+        return f"Error: {str(e)}", "", document_id
 
 
-def ask_question(question, chat_history):
-    if not question.strip():
-        return chat_history, ""
+def iter_sse(response):
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
 
-    try:
-        print(f"[ASK] Question: {question}")
-        
-        response = requests.post(
-            f"{API_URL}/ask",
-            json={"question": question, "k": 4}
-        )
 
-        if response.status_code == 200:
-            data = response.json()
-            answer = data['answer']
-            print(f"[ASK] Answer received: {answer[:50]}...")
-            
-            sources_text = "**Sources:**\n\n"
-            for i, src in enumerate(data['sources'], 1):
-                sources_text += f"{i}. {src['source']} (Chunk #{src['chunk_id']})\n"
-            
-            chat_history.append((question, answer))
-            return chat_history, sources_text
+def format_sources_text(sources):
+    sources_text = "**Sources:**\n\n"
+    for i, src in enumerate(sources, 1):
+        sources_text += f"{i}. {src['source']} (Chunk #{src['chunk_id']})\n"
+    return sources_text
 
-        else:
-            error = response.json()['detail']
-            print(f"[ASK] Error: {error}")
-            chat_history.append((question, f"Error: {error}"))
-            return chat_history, ""
+
+def ask_question(question, chat_history, document_id, request: gr.Request):
+    if not question.strip():
+        yield chat_history, ""
+        return
+    if not document_id:
+        chat_history.append((question, "Please upload a document first."))
+        yield chat_history, ""
+        return
+
+    sources_text = ""
+    try:
+        start = time.perf_counter()
+        with api(
+            "POST", "/ask/stream",
+            json={"question": question, "k": 4, "document_id": document_id, "session_id": session_id(request)},
+            stream=True
+        ) as response:
+            if response.status_code == 200:
+                answer = ""
+                chat_history.append((question, ""))
+
+                for event, data in iter_sse(response):
+                    if event == "sources":
+                        sources_text = format_sources_text(data['sources'])
+                    elif event == "token":
+                        answer += data['content']
+                    elif event == "done":
+                        answer = data['answer']
+                    elif event == "error":
+                        answer = f"Error: {data['detail']}"
+                    chat_history[-1] = (question, answer)
+                    yield chat_history, sources_text
+
+                log_event(logger, "ask_done", question=question, answer_chars=len(answer),
+                          duration_ms=round((time.perf_counter() - start) * 1000, 3))
+
+            else:
+                error = response.json()['detail']
+                log_event(logger, "ask_failed", logging.WARNING, question=question, error=error)
+                chat_history.append((question, f"Error: {error}"))
+                yield chat_history, ""
 
     except Exception as e:
-        print(f"[ASK] Exception: {str(e)}")
+        logger.exception("ask_failed")
         chat_history.append((question, f"Error: {str(e)}"))
-        return chat_history, ""
+        yield chat_history, sources_text
 
 
-def clear_chat():
+def clear_chat(request: gr.Request):
     try:
-        print("[CLEAR] Clearing chat history")
-        requests.delete(f"{API_URL}/history")
-        print("[CLEAR] History cleared")
-    except Exception as e:
-        print(f"[CLEAR] Error: {str(e)}")
+        api("DELETE", "/history", params={"session_id": session_id(request)})
+        log_event(logger, "history_cleared", session_id=session_id(request))
+    except Exception:
+        logger.exception("history_clear_failed")
     return [], ""
 
 
-def get_summary():
+def get_summary(document_id):
+    if not document_id:
+        yield "Cannot generate summary. Please upload a document first."
+        return
+
     try:
-        print("[SUMMARY] Requesting document summary")
-        response = requests.post(
-            f"{API_URL}/ask",
-            json={"question": "Summarize this document in clear points", "k": 5}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            summary = data['answer']
-            print(f"[SUMMARY] Summary received")
-            return f"**Document Summary:**\n\n{summary}"
-        else:
-            return "Cannot generate summary. Please upload a document first."
-            
+        with api("GET", "/summary/stream", params={"document_id": document_id}, stream=True) as response:
+            if response.status_code != 200:
+                yield "Cannot generate summary. Please upload a document first."
+                return
+
+            summary = ""
+            for event, data in iter_sse(response):
+                if event == "progress":
+                    yield f"Summarizing ({data['stage']} step, {data['total']} parts)..."
+                elif event == "token":
+                    summary += data['content']
+                    yield f"**Document Summary:**\n\n{summary}"
+                elif event == "done":
+                    log_event(logger, "summary_done", cached=data['cached'], sections=data['sections'],
+                              elapsed_ms=data['elapsed_ms'])
+                    yield f"**Document Summary:**\n\n{data['summary']}"
+                elif event == "error":
+                    yield f"Error: {data['detail']}"
+
     except Exception as e:
-        print(f"[SUMMARY] Error: {str(e)}")
-        return f"Error: {str(e)}"
+        logger.exception("summary_failed")
+        yield f"Error: {str(e)}"
 
 
-def show_history():
+def show_history(request: gr.Request):
     try:
-        print("[HISTORY] Fetching chat history")
-        response = requests.get(f"{API_URL}/history")
+        response = api("GET", "/history", params={"session_id": session_id(request)})
         
         if response.status_code == 200:
             data = response.json()
@@ -116,50 +217,48 @@ def show_history():
                 formatted += f"**[{i}] Q:** {item['question']}\n"
                 formatted += f"**A:** {item['answer']}\n\n"
             
-            print(f"[HISTORY] Found {len(history)} items")
+            log_event(logger, "history_fetched", items=len(history))
             return formatted
         else:
             return "Cannot retrieve history"
             
-    except Exception as e:
-        print(f"[HISTORY] Error: {str(e)}")
+    except Exception:
+        logger.exception("history_failed")
         return "Server not running"
 
 
-def get_stats():
+def get_stats(request: gr.Request):
     try:
-        print("[STATS] Fetching statistics")
-        response = requests.get(f"{API_URL}/history")
+        response = api("GET", "/history", params={"session_id": session_id(request)})
         
         if response.status_code == 200:
             data = response.json()
             total = data['total']
-            print(f"[STATS] Total questions: {total}")
+            log_event(logger, "stats_fetched", total=total)
             return f"**Total Questions:** {total}\n**Server:** Connected"
         else:
             return "Cannot retrieve stats"
             
-    except Exception as e:
-        print(f"[STATS] Error: {str(e)}")
+    except Exception:
+        logger.exception("stats_failed")
         return "Server not running"
 
 
 def check_connection():
     try:
-        print("[CONNECTION] Checking server connection")
-        response = requests.get(f"{API_URL}/health")
+        response = api("GET", "/health")
         
         if response.status_code == 200:
             data = response.json()
             status = "Connected" if data['status'] == 'healthy' else "Not Ready"
             doc_loaded = "Yes" if data['document_loaded'] else "No"
-            print(f"[CONNECTION] Server: {status}, Document: {doc_loaded}")
+            log_event(logger, "connection_checked", status=status, document_loaded=doc_loaded)
             return f"**Server Status:** {status}\n**Document Loaded:** {doc_loaded}"
         else:
             return "Cannot connect to server"
             
-    except Exception as e:
-        print(f"[CONNECTION] Error: {str(e)}")
+    except Exception:
+        logger.exception("connection_failed")
         return "Server not running. Please start server.py first."
 
 
@@ -173,6 +272,7 @@ custom_css = """
 with gr.Blocks(title="Smart Contract Assistant", theme=gr.themes.Soft(), css=custom_css) as demo:
 
     gr.Markdown("# Smart Contract Assistant\nAI-Powered Document Analysis System (Connected to FastAPI)")
+    document_state = gr.State(None)
 
     with gr.Tabs():
 
@@ -188,7 +288,8 @@ with gr.Blocks(title="Smart Contract Assistant", theme=gr.themes.Soft(), css=cus
                     upload_status = gr.Textbox(label="Status", lines=3, interactive=False)
                     file_info_output = gr.Textbox(label="File Details", lines=3, interactive=False)
 
-            upload_btn.click(fn=upload_file, inputs=[file_input], outputs=[upload_status, file_info_output])
+            upload_btn.click(fn=upload_file, inputs=[file_input, document_state],
+                             outputs=[upload_status, file_info_output, document_state])
 
         with gr.Tab("Chat"):
             gr.Markdown("Ask questions about your document")
@@ -213,10 +314,10 @@ with gr.Blocks(title="Smart Contract Assistant", theme=gr.themes.Soft(), css=cus
 
                     extra_output = gr.Textbox(label="Results", lines=8, interactive=False)
 
-            submit_btn.click(fn=ask_question, inputs=[question_input, chatbot], outputs=[chatbot, sources_display]).then(fn=lambda: "", outputs=[question_input])
-            question_input.submit(fn=ask_question, inputs=[question_input, chatbot], outputs=[chatbot, sources_display]).then(fn=lambda: "", outputs=[question_input])
+            submit_btn.click(fn=ask_question, inputs=[question_input, chatbot, document_state], outputs=[chatbot, sources_display]).then(fn=lambda: "", outputs=[question_input])
+            question_input.submit(fn=ask_question, inputs=[question_input, chatbot, document_state], outputs=[chatbot, sources_display]).then(fn=lambda: "", outputs=[question_input])
             clear_btn.click(fn=clear_chat, outputs=[chatbot, sources_display])
-            summary_btn.click(fn=get_summary, outputs=[extra_output])
+            summary_btn.click(fn=get_summary, inputs=[document_state], outputs=[extra_output])
             history_btn.click(fn=show_history, outputs=[extra_output])
             stats_btn.click(fn=get_stats, outputs=[extra_output])
             connect_btn.click(fn=check_connection, outputs=[extra_output])
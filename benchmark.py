@@ -0,0 +1,377 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import textwrap
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+PARTIES = ["ABC Company", "XYZ Corporation", "Northwind Traders", "Contoso Ltd", "Globex Inc", "Initech LLC"]
+
+CLAUSES = [
+    "{a} shall pay {b} the sum of ${amount:,} within {days} days of receiving a valid invoice.",
+    "This Agreement shall remain in force for {months} months from the Effective Date unless terminated earlier.",
+    "Either party may terminate this Agreement by giving {days} days written notice to the other party.",
+    "{a} shall be responsible for any damages arising from its negligence or wilful misconduct.",
+    "All confidential information disclosed by {b} shall be kept strictly confidential by {a}.",
+    "{a} warrants that the services will be performed with reasonable skill, care and diligence.",
+    "Any dispute arising under this Agreement shall be referred to arbitration in accordance with the rules.",
+    "Neither party shall be liable for delays caused by events beyond its reasonable control.",
+    "{b} may audit the records of {a} relating to this Agreement upon {days} days notice.",
+    "Intellectual property created under this Agreement shall vest in {b} upon full payment."
+]
+
+QUESTIONS = [
+    "Who are the parties in this contract?",
+    "What is the contract duration?",
+    "What is the total value?",
+    "What are the termination conditions?",
+    "Who is responsible for damages?",
+    "What are the confidentiality obligations?",
+    "How are disputes resolved?",
+    "Section 4.2",
+    "$50,000",
+    "Who owns the intellectual property?"
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    ordered = sorted(values)
+
+    def pick(pct):
+        return round(ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)], 3)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "mean": round(sum(ordered) / len(ordered), 3)}
+
+
+def contract_pages(pages: int, clauses_per_page: int = 8, seed: int = 0) -> List[List[str]]:
+    rng = random.Random(seed)
+    content = []
+    for page in range(1, pages + 1):
+        paragraphs = []
+        for i in range(1, clauses_per_page + 1):
+            a, b = rng.sample(PARTIES, 2)
+            clause = rng.choice(CLAUSES).format(
+                a=a, b=b, amount=rng.choice([5000, 12500, 50000, 120000]),
+                days=rng.choice([14, 30, 60, 90]), months=rng.choice([6, 12, 24, 36])
+            )
+            paragraphs.append(f"Section {page}.{i}. {clause}")
+        content.append(paragraphs)
+    return content
+
+
+def write_docx(path: str, content: List[List[str]]):
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+
+    doc = Document()
+    doc.add_heading("Service Agreement", level=1)
+    doc.add_paragraph(f"This Agreement is made between {PARTIES[0]} (Party A) and {PARTIES[1]} (Party B).")
+    for page, paragraphs in enumerate(content, 1):
+        for paragraph in paragraphs:
+            doc.add_paragraph(paragraph)
+        if page < len(content):
+            doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    doc.save(path)
+
+
+def write_pdf(path: str, content: List[List[str]]):
+    # A plain text PDF (Helvetica, one contract page per PDF page) written by
+    # hand, since PyPDF2 can read PDFs but not lay out text.
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page, paragraphs in enumerate(content, 1):
+        lines = []
+        if page == 1:
+            lines += ["Service Agreement", "",
+                      f"This Agreement is made between {PARTIES[0]} (Party A) and {PARTIES[1]} (Party B).", ""]
+        for paragraph in paragraphs:
+            lines += textwrap.wrap(paragraph, 95) + [""]
+        text = " T* ".join(f"({escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 72 720 Td {text} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_contract(path: str, pages: int, clauses_per_page: int = 8, seed: int = 0) -> str:
+    # The format follows the extension: PDF goes through the process-pool page
+    # extraction, DOCX is read in-process.
+    content = contract_pages(pages, clauses_per_page, seed)
+    if path.endswith(".pdf"):
+        write_pdf(path, content)
+    else:
+        write_docx(path, content)
+    return path
+
+
+def bench_ingestion(path: str, pages: int, save_name: str, storage: str = "float32") -> Dict[str, Any]:
+    from src.ingestion import DocumentIngestion
+
+    ingestion = DocumentIngestion(use_cache=False, storage=storage)
+
+    start = time.perf_counter()
+    documents = ingestion.process_document(path)
+    extract_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ingestion.embed_documents(documents)
+    embed_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ingestion.ingest_document(path, save_name)
+    total_s = time.perf_counter() - start
+
+    return {
+        "pages": pages,
+        "chunks": len(documents),
+        "extract_chunk_s": round(extract_s, 3),
+        "embed_s": round(embed_s, 3),
+        "ingest_total_s": round(total_s, 3),
+        "pages_per_s": round(pages / total_s, 2),
+        "chunks_per_s": round(len(documents) / total_s, 2),
+        "embeddings_per_s": round(len(documents) / embed_s, 2) if embed_s else 0.0,
+        "footprint": ingestion.footprint
+    }
+
+
+def bench_retrieval(save_name: str, rounds: int, k: int) -> Dict[str, Any]:
+    from src.embeddings import get_embeddings
+    from src.ingestion import DocumentIngestion
+    from src.retrieval import DocumentRetriever
+
+    vectorstore = DocumentIngestion().load_vectorstore(save_name)
+    report = {"num_vectors": vectorstore.index.ntotal}
+
+    for mode in ("vector", "hybrid"):
+        # Uncached embeddings so every round pays for the query embedding.
+        retriever = DocumentRetriever(vectorstore, k=k, embeddings=get_embeddings(), mode=mode)
+        latencies = []
+        for _ in range(rounds):
+            for question in QUESTIONS:
+                start = time.perf_counter()
+                retriever.search_with_scores(question, k=k)
+                latencies.append((time.perf_counter() - start) * 1000)
+        report[mode] = {"latency_ms": percentiles(latencies), "paths": retriever.stats()}
+
+    return report
+
+
+def top_k(documents, queries, k: int):
+    import numpy as np
+
+    scores = np.asarray(queries) @ np.asarray(documents).T
+    return [set(row) for row in np.argsort(-scores, axis=1)[:, :k]]
+
+
+def bench_embedding_backends(path: str, backends: List[str], k: int, batch_size: int,
+                             num_threads: int) -> Dict[str, Any]:
+    # Every backend embeds the same chunks; recall is the overlap of its top-k
+    # with the torch top-k, both on its own vectors and with its queries run
+    # against the torch index (the mixed case an existing index sees).
+    import numpy as np
+    from src.embeddings import DEFAULT_MODEL
+    from src.ingestion import DocumentIngestion
+    from src.onnx_embeddings import create_embeddings
+
+    texts = [doc.page_content for doc in DocumentIngestion(use_cache=False).process_document(path)]
+    report, vectors = {}, {}
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        model = create_embeddings(DEFAULT_MODEL, backend, batch_size=batch_size, num_threads=num_threads)
+        model.embed_documents(texts[:batch_size])
+
+        start = time.perf_counter()
+        documents = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        embed_s = time.perf_counter() - start
+        queries = np.asarray([model.embed_query(q) for q in QUESTIONS], dtype=np.float32)
+        vectors[backend] = (documents, queries)
+
+        report[backend] = {
+            "embed_s": round(embed_s, 3),
+            "embeddings_per_s": round(len(texts) / embed_s, 2) if embed_s else 0.0
+        }
+
+    base_documents, base_queries = vectors["torch"]
+    expected = top_k(base_documents, base_queries, k)
+    for backend, (documents, queries) in vectors.items():
+        own = top_k(documents, queries, k)
+        mixed = top_k(base_documents, queries, k)
+        cosine = (documents * base_documents).sum(axis=1) / (
+            np.linalg.norm(documents, axis=1) * np.linalg.norm(base_documents, axis=1))
+        report[backend].update({
+            "speedup": round(report[backend]["embeddings_per_s"] / report["torch"]["embeddings_per_s"], 2),
+            f"recall_at_{k}": round(sum(len(a & b) for a, b in zip(own, expected)) / (k * len(expected)), 3),
+            f"mixed_recall_at_{k}": round(sum(len(a & b) for a, b in zip(mixed, expected)) / (k * len(expected)), 3),
+            "min_cosine_to_torch": round(float(cosine.min()), 4)
+        })
+
+    return {"chunks": len(texts), "batch_size": batch_size, "num_threads": num_threads, "backends": report}
+
+
+def bench_end_to_end(save_name: str, rounds: int, llm_delay: float) -> Dict[str, Any]:
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_DELAY"] = str(llm_delay)
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+
+    from fastapi.testclient import TestClient
+    import server
+
+    client = TestClient(server.app)
+    latencies, errors = [], 0
+    for _ in range(rounds):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            response = client.post("/ask", json={"question": question, "document_id": save_name})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    return {
+        "llm_delay_s": llm_delay,
+        "requests": len(latencies),
+        "errors": errors,
+        "latency_ms": percentiles(latencies),
+        "overhead_ms_p50": round(percentiles(latencies)["p50"] - llm_delay * 1000, 3)
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(old_path: str, new: Dict[str, Any]):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+
+    print(f"\nComparison against {old.get('commit')} ({old_path})")
+    print("=" * 60)
+    for name, result in new["corpora"].items():
+        previous = old.get("corpora", {}).get(name)
+        if not previous and result["format"] == "docx":
+            # Results saved before PDF corpora were keyed by page count alone.
+            previous = old.get("corpora", {}).get(str(result["pages"]))
+        if not previous:
+            continue
+        rows = [
+            ("embeddings/s", previous["ingestion"]["embeddings_per_s"], result["ingestion"]["embeddings_per_s"]),
+            ("retrieval p95 ms", previous["retrieval"]["hybrid"]["latency_ms"]["p95"],
+             result["retrieval"]["hybrid"]["latency_ms"]["p95"]),
+            ("/ask p95 ms", previous["end_to_end"]["latency_ms"]["p95"], result["end_to_end"]["latency_ms"]["p95"])
+        ]
+        for metric, before, after in rows:
+            change = (after - before) / before if before else 0.0
+            print(f"{name:<10} {metric:<18}{before:>10.2f} -> {after:>10.2f}  ({change:+.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion, retrieval and end-to-end benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--formats", nargs="+", choices=["docx", "pdf"], default=["docx", "pdf"],
+                        help="Contract formats to generate; PDF exercises the parallel page extraction")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--llm-delay", type=float, default=0.2)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="Previous benchmark JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep generated contracts and indexes")
+    parser.add_argument("--storage", choices=["float32", "float16", "sq8"], default="float32",
+                        help="Vector storage of the benchmarked indexes")
+    parser.add_argument("--embedding-backends", nargs="*", default=["onnx", "onnx-int8"],
+                        help="Embedding backends to compare against torch (none to skip)")
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--embed-threads", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs("benchmarks", exist_ok=True)
+    os.makedirs("data", exist_ok=True)
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "corpora": {}
+    }
+
+    for pages in args.pages:
+        for fmt in args.formats:
+            name = f"{pages}p_{fmt}"
+            save_name = f"bench_{name}"
+            path = generate_contract(f"data/{save_name}.{fmt}", pages, seed=pages)
+            print(f"[BENCH] {pages} pages {fmt}: ingestion")
+            ingestion = bench_ingestion(path, pages, save_name, args.storage)
+            print(f"[BENCH] {pages} pages {fmt}: retrieval")
+            retrieval = bench_retrieval(save_name, args.rounds, args.k)
+            print(f"[BENCH] {pages} pages {fmt}: end-to-end /ask")
+            end_to_end = bench_end_to_end(save_name, args.rounds, args.llm_delay)
+
+            results["corpora"][name] = {
+                "pages": pages,
+                "format": fmt,
+                "ingestion": ingestion,
+                "retrieval": retrieval,
+                "end_to_end": end_to_end
+            }
+            # Both formats hold the same text, so backends are compared once per size.
+            if args.embedding_backends and fmt == args.formats[0]:
+                print(f"[BENCH] {pages} pages {fmt}: embedding backends")
+                results["corpora"][name]["embedding_backends"] = bench_embedding_backends(
+                    path, args.embedding_backends, args.k, args.embed_batch_size, args.embed_threads
+                )
+
+            if not args.keep:
+                os.remove(path)
+                shutil.rmtree(f"vectorstore/{save_name}", ignore_errors=True)
+
+    output = args.output or f"benchmarks/{datetime.now():%Y%m%d_%H%M%S}_{results['commit']}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print("\nBenchmark Summary")
+    print("=" * 60)
+    for name, result in results["corpora"].items():
+        print(f"{name:>10} | {result['ingestion']['pages_per_s']:>7.1f} pages/s | "
+              f"{result['ingestion']['embeddings_per_s']:>8.1f} emb/s | "
+              f"retrieval p95 {result['retrieval']['hybrid']['latency_ms']['p95']:>7.2f} ms | "
+              f"/ask p95 {result['end_to_end']['latency_ms']['p95']:>8.2f} ms | "
+              f"index {result['ingestion']['footprint']['resident_mb']:>7.2f} MB")
+        for backend, stats in result.get("embedding_backends", {}).get("backends", {}).items():
+            print(f"{'':>12} {backend:<10} {stats['embeddings_per_s']:>8.1f} emb/s | x{stats['speedup']:.2f} | "
+                  f"recall@{args.k} {stats[f'recall_at_{args.k}']:.3f} | "
+                  f"mixed {stats[f'mixed_recall_at_{args.k}']:.3f}")
+    print(f"\nResults saved: {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Set, Tuple, Union
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+CHUNKS_FILE = "chunks.sqlite"
+LEGACY_FILE = "index.pkl"
+MMAP_SIZE = int(os.getenv("CHUNK_STORE_MMAP_MB", "256")) * 1024 * 1024
+BATCH_SIZE = 500
+
+
+class ChunkStore(Docstore, AddableMixin):
+    # Read-only view of a saved chunks.sqlite. Adds and deletes made while an
+    # index is being edited are kept in memory until commit().
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, CHUNKS_FILE)
+        self.added = {}
+        self.deleted = set()
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            # Reads go through the OS page cache, so workers share one copy.
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def search(self, search: str) -> Union[str, Document]:
+        found = self.search_many([search])
+        return found.get(search, f"ID {search} not found.")
+
+    def search_many(self, ids: List[str]) -> Dict[str, Document]:
+        found = {}
+        missing = []
+        for doc_id in ids:
+            if doc_id in self.added:
+                found[doc_id] = self.added[doc_id]
+            elif doc_id not in self.deleted:
+                missing.append(doc_id)
+
+        conn = self._conn()
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start:start + BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", batch
+            ).fetchall()
+            for doc_id, text, metadata in rows:
+                found[doc_id] = Document(page_content=text, metadata=json.loads(metadata))
+        return found
+
+    def add(self, texts: Dict[str, Document]):
+        self.added.update(texts)
+        self.deleted.difference_update(texts)
+
+    def delete(self, ids: List[str]):
+        for doc_id in ids:
+            self.added.pop(doc_id, None)
+            self.deleted.add(doc_id)
+
+    def commit(self, ids: List[str]) -> Tuple[Set[str], List[Tuple[str, Document]]]:
+        # Applies the pending edits to chunks.sqlite in one transaction and
+        # returns them. Re-added ids are deleted first; new rows are appended
+        # in index order, after every surviving row, as FAISS appends them.
+        removed = self.deleted | set(self.added)
+        added = [(doc_id, self.added[doc_id]) for doc_id in ids if doc_id in self.added]
+        if not removed:
+            return removed, added
+
+        conn = sqlite3.connect(self.path)
+        with conn:
+            batch_ids = list(removed)
+            for start in range(0, len(batch_ids), BATCH_SIZE):
+                batch = batch_ids[start:start + BATCH_SIZE]
+                conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+            first = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM chunks").fetchone()[0]
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", (
+                (first + i, doc_id, doc.metadata.get("source"), doc.page_content, json.dumps(doc.metadata))
+                for i, (doc_id, doc) in enumerate(added)
+            ))
+        conn.close()
+
+        self.added, self.deleted = {}, set()
+        return removed, added
+
+    def ids(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT id FROM chunks ORDER BY position")]
+
+    def ids_for_source(self, source: str) -> List[str]:
+        rows = self._conn().execute("SELECT id FROM chunks WHERE source = ? ORDER BY position", (source,))
+        ids = [row[0] for row in rows if row[0] not in self.deleted and row[0] not in self.added]
+        ids.extend(doc_id for doc_id, doc in self.added.items() if doc.metadata.get("source") == source)
+        return ids
+
+    def sources(self) -> List[str]:
+        if self.deleted:
+            rows = self._conn().execute("SELECT id, source FROM chunks")
+            sources = {source for doc_id, source in rows if doc_id not in self.deleted}
+        else:
+            sources = {row[0] for row in self._conn().execute("SELECT DISTINCT source FROM chunks")}
+        sources.update(doc.metadata.get("source") for doc in self.added.values())
+        return sorted(source for source in sources if source is not None)
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": len(self),
+            "size_mb": round(os.path.getsize(self.path) / 1024 / 1024, 2),
+            "pending_adds": len(self.added),
+            "pending_deletes": len(self.deleted)
+        }
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, CHUNKS_FILE))
+
+    @staticmethod
+    def write(folder: str, documents: Iterable[Tuple[str, Document]]) -> int:
+        # Written beside the live file and swapped in, so readers that already
+        # hold the old file keep a consistent view.
+        path = os.path.join(folder, CHUNKS_FILE)
+        temp_path = path + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        conn = sqlite3.connect(temp_path)
+        conn.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "source TEXT, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = (
+            (position, doc_id, doc.metadata.get("source"), doc.page_content, json.dumps(doc.metadata))
+            for position, (doc_id, doc) in enumerate(documents)
+        )
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE INDEX idx_source ON chunks(source)")
+        count = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        conn.commit()
+        conn.close()
+
+        os.replace(temp_path, path)
+        return count
+
+
+def fetch_documents(docstore, ids: List[str]) -> Dict[str, Document]:
+    if hasattr(docstore, "search_many"):
+        return docstore.search_many(ids)
+    found = {}
+    for doc_id in ids:
+        doc = docstore.search(doc_id)
+        if isinstance(doc, Document):
+            found[doc_id] = doc
+    return found
+
+
+def iter_documents(vectorstore) -> Iterable[Tuple[str, Document]]:
+    ids = [doc_id for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())]
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        found = fetch_documents(vectorstore.docstore, batch)
+        for doc_id in batch:
+            if doc_id in found:
+                yield doc_id, found[doc_id]
+
+
+def migrate(folder: str) -> int:
+    # One-off conversion of an index saved by FAISS.save_local. This is the
+    # only place a pickle is read; run it only on indexes you created.
+    import pickle
+
+    with open(os.path.join(folder, LEGACY_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    ids = [doc_id for _, doc_id in sorted(index_to_docstore_id.items())]
+    count = ChunkStore.write(folder, ((doc_id, docstore.search(doc_id)) for doc_id in ids))
+    os.remove(os.path.join(folder, LEGACY_FILE))
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled FAISS indexes to the chunks.sqlite format")
+    parser.add_argument("names", nargs="*", help="Index names under ./vectorstore (default: all legacy ones)")
+    args = parser.parse_args()
+
+    names = args.names or sorted(
+        name for name in os.listdir("vectorstore")
+        if os.path.exists(os.path.join("vectorstore", name, LEGACY_FILE))
+    )
+    for name in names:
+        count = migrate(os.path.join("vectorstore", name))
+        print(f"{name}: {count} chunks migrated")
+
+
+if __name__ == "__main__":
+    main()
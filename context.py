@@ -0,0 +1,140 @@
+import os
+import re
+from typing import Any, Dict, List, Tuple
+from langchain.schema import Document
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "cl100k_base")
+SEPARATOR = "\n\n---\n\n"
+
+_SENTENCE_END = re.compile(r"[.!?;:]\s")
+
+
+class TokenCounter:
+
+    def __init__(self, name: str = TOKENIZER_NAME):
+        self.name = name
+        self._encode = None
+        try:
+            import tiktoken
+            self._encode = tiktoken.get_encoding(name).encode
+        except Exception:
+            try:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                self._encode = lambda text: tokenizer.encode(text, add_special_tokens=False)
+            except Exception:
+                self.name = "chars/4"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encode is None:
+            return (len(text) + 3) // 4
+        return len(self._encode(text))
+
+
+_counter = None
+
+
+def get_token_counter() -> TokenCounter:
+    global _counter
+    if _counter is None:
+        _counter = TokenCounter()
+    return _counter
+
+
+def overlap_length(left: str, right: str, max_overlap: int) -> int:
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, 19, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def truncate_to_sentence(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    return cut[:ends[-1]].rstrip() if ends else cut.rstrip()
+
+
+class ContextBuilder:
+
+    def __init__(self, max_tokens: int = CONTEXT_TOKEN_BUDGET, chunk_overlap: int = 150,
+                 counter: TokenCounter = None):
+        self.max_tokens = max_tokens
+        self.max_overlap = chunk_overlap + 50
+        self.counter = counter or get_token_counter()
+
+    def _render(self, selected: List[Tuple[int, Document]]) -> str:
+        groups = {}
+        for rank, doc in selected:
+            groups.setdefault(doc.metadata.get("source"), []).append((rank, doc))
+
+        # Merge runs of adjacent chunks, dropping the splitter's overlap between them.
+        spans = []
+        for items in groups.values():
+            items.sort(key=lambda item: item[1].metadata.get("chunk_id", -1))
+            current_rank, current_text, last_id = None, "", None
+            for rank, doc in items:
+                chunk_id = doc.metadata.get("chunk_id", -1)
+                if last_id is not None and chunk_id == last_id + 1:
+                    size = overlap_length(current_text, doc.page_content, self.max_overlap)
+                    joiner = "" if size else " "
+                    current_text = current_text + joiner + doc.page_content[size:]
+                    current_rank = min(current_rank, rank)
+                else:
+                    if last_id is not None:
+                        spans.append((current_rank, current_text))
+                    current_rank, current_text = rank, doc.page_content
+                last_id = chunk_id
+            spans.append((current_rank, current_text))
+
+        spans.sort(key=lambda span: span[0])
+        return SEPARATOR.join(text for _, text in spans)
+
+    def build(self, docs_with_scores: List[tuple]) -> Dict[str, Any]:
+        if not docs_with_scores:
+            return {"context": "", "sources": [], "num_results": 0, "context_tokens": 0, "tokens_saved": 0}
+
+        naive_tokens = self.counter.count(SEPARATOR.join(doc.page_content for doc, _ in docs_with_scores))
+
+        selected = []
+        context = ""
+        for rank, (doc, _) in enumerate(docs_with_scores):
+            candidate = self._render(selected + [(rank, doc)])
+            if self.counter.count(candidate) <= self.max_tokens:
+                selected.append((rank, doc))
+                context = candidate
+
+        if not selected:
+            doc = docs_with_scores[0][0]
+            ratio = self.max_tokens / max(self.counter.count(doc.page_content), 1)
+            trimmed = Document(
+                page_content=truncate_to_sentence(doc.page_content, int(len(doc.page_content) * ratio)),
+                metadata=doc.metadata
+            )
+            selected = [(0, trimmed)]
+            context = trimmed.page_content
+
+        context_tokens = self.counter.count(context)
+        sources = [
+            {
+                "source": doc.metadata.get("source", "Unknown"),
+                "chunk_id": doc.metadata.get("chunk_id", -1),
+                "page": doc.metadata.get("page"),
+                "score": float(docs_with_scores[rank][1])
+            }
+            for rank, doc in sorted(selected, key=lambda item: item[0])
+        ]
+
+        return {
+            "context": context,
+            "sources": sources,
+            "num_results": len(selected),
+            "context_tokens": context_tokens,
+            "tokens_saved": max(naive_tokens - context_tokens, 0),
+            "tokenizer": self.counter.name
+        }
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from langchain_community.vectorstores import FAISS
+from src.indexing import load_footprint
+from src.ingestion import DocumentIngestion
+
+VECTORSTORE_DIR = "vectorstore"
+
+
+def estimate_vectorstore_bytes(vectorstore: FAISS, folder: Optional[str] = None) -> int:
+    # Charge what the index really keeps resident (sq8 codes are a quarter of
+    # float32) plus the BM25 postings; chunk text in ChunkStore stays on disk.
+    report = load_footprint(folder) if folder else None
+    if report:
+        size = int(report["resident_mb"] * 1024 * 1024)
+    else:
+        index = vectorstore.index
+        size = index.ntotal * index.d * 4
+    lexical_index = getattr(vectorstore, "lexical_index", None)
+    if lexical_index is not None:
+        size += lexical_index.memory_bytes()
+    for doc in getattr(vectorstore.docstore, "_dict", {}).values():
+        size += len(doc.page_content.encode("utf-8")) + 200
+    return size
+
+
+class IndexRegistry:
+
+    def __init__(self, memory_budget_mb: float = 512, build: Optional[Callable] = None,
+                 ingestion: Optional[DocumentIngestion] = None, on_update: Optional[Callable] = None):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.build = build or (lambda document_id, vectorstore: vectorstore)
+        self.on_update = on_update
+        self._ingestion = ingestion
+        self._ingestion_lock = threading.Lock()
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_time_total = 0.0
+        self.load_time_max = 0.0
+
+    @property
+    def ingestion(self) -> DocumentIngestion:
+        # Built on first load, not at import: DocumentIngestion loads the
+        # embedding model, which the server warms up in the background.
+        if self._ingestion is None:
+            with self._ingestion_lock:
+                if self._ingestion is None:
+                    self._ingestion = DocumentIngestion()
+        return self._ingestion
+
+    @staticmethod
+    def is_valid_id(document_id: str) -> bool:
+        return bool(document_id) and os.path.basename(document_id) == document_id \
+            and document_id not in (".", "..")
+
+    def get(self, document_id: str) -> Optional[Any]:
+        if not self.is_valid_id(document_id):
+            return None
+
+        with self._lock:
+            entry = self.entries.get(document_id)
+            if entry is not None:
+                self.entries.move_to_end(document_id)
+                self.hits += 1
+                return entry["value"]
+            self.misses += 1
+
+        start = time.perf_counter()
+        vectorstore = self.ingestion.load_vectorstore(document_id)
+        if vectorstore is None:
+            return None
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.loads += 1
+            self.load_time_total += elapsed
+            self.load_time_max = max(self.load_time_max, elapsed)
+
+        return self._insert(document_id, vectorstore)
+
+    def put(self, document_id: str, vectorstore: FAISS) -> Any:
+        if not self.is_valid_id(document_id):
+            raise ValueError(f"Invalid document id: {document_id}")
+        # Invalidated before the new entry is built, so it is built for the
+        # new cache generation and answers from the old one are discarded.
+        if self.on_update:
+            self.on_update(document_id)
+        return self._insert(document_id, vectorstore, replace=True)
+
+    def _insert(self, document_id: str, vectorstore: FAISS, replace: bool = False) -> Any:
+        # The entry is built without the lock, so a cold load does not hold up
+        # lookups of other documents; only the swap happens under it.
+        value = self.build(document_id, vectorstore)
+        size = estimate_vectorstore_bytes(vectorstore, os.path.join(VECTORSTORE_DIR, document_id))
+
+        with self._lock:
+            existing = self.entries.get(document_id)
+            if existing is not None and not replace:
+                self.entries.move_to_end(document_id)
+                return existing["value"]
+
+            self.entries[document_id] = {
+                "value": value,
+                "bytes": size,
+                "loaded_at": time.time()
+            }
+            self.entries.move_to_end(document_id)
+            self._enforce_budget(keep=document_id)
+            return self.entries[document_id]["value"]
+
+    def _enforce_budget(self, keep: str):
+        while self.memory_bytes() > self.memory_budget and len(self.entries) > 1:
+            oldest = next(iter(self.entries))
+            if oldest == keep:
+                break
+            del self.entries[oldest]
+            self.evictions += 1
+
+    def evict(self, document_id: str) -> bool:
+        with self._lock:
+            return self.entries.pop(document_id, None) is not None
+
+    def memory_bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self.entries.values())
+
+    def is_loaded(self, document_id: str) -> bool:
+        return document_id in self.entries
+
+    @staticmethod
+    def persisted_documents() -> List[str]:
+        # Names of saved indexes, newest index.faiss first (ties by name), so
+        # the order does not depend on the directory listing; nothing is loaded.
+        if not os.path.isdir(VECTORSTORE_DIR):
+            return []
+        saved = []
+        for entry in os.scandir(VECTORSTORE_DIR):
+            path = os.path.join(entry.path, "index.faiss")
+            if entry.is_dir() and os.path.exists(path):
+                saved.append((-os.path.getmtime(path), entry.name))
+        return [name for _, name in sorted(saved)]
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        names = set(self.entries)
+        names.update(self.persisted_documents())
+
+        return [
+            {
+                "document_id": name,
+                "loaded": name in self.entries,
+                "size_mb": round(self.entries[name]["bytes"] / 1024 / 1024, 2) if name in self.entries else None
+            }
+            for name in sorted(names)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "loaded": len(self.entries),
+            "memory_mb": round(self.memory_bytes() / 1024 / 1024, 2),
+            "memory_budget_mb": round(self.memory_budget / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "avg_load_ms": round(self.load_time_total / self.loads * 1000, 2) if self.loads else 0.0,
+            "max_load_ms": round(self.load_time_max * 1000, 2)
+        }
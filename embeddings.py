@@ -0,0 +1,218 @@
+import os
+import re
+import resource
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+from langchain.schema.embeddings import Embeddings
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+WARMUP_TEXTS = [
+    "This Agreement is entered into by and between the parties.",
+    "The term of this contract shall be twelve (12) months.",
+    "Either party may terminate with thirty (30) days written notice.",
+    "The total contract value is $50,000.",
+]
+
+
+def _rss_kb() -> int:
+    # Current resident set. ru_maxrss is the process peak, so a load that
+    # stays under an earlier high-water mark would show no growth; it is only
+    # the fallback where /proc is missing.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _model_bytes(embeddings) -> int:
+    client = getattr(embeddings, "client", None)
+    if client is None or not hasattr(client, "parameters"):
+        return 0
+    return sum(p.numel() * p.element_size() for p in client.parameters())
+
+
+def model_key(model_name: str, backend: Optional[str] = None) -> str:
+    backend = backend or EMBEDDING_BACKEND
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    # Normalized text is only the cache key; the model embeds the first
+    # original text seen for each key, exactly as an uncached call would.
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_entries: int = QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.precomputed = 0
+
+    def _lookup(self, key: str):
+        with self._lock:
+            vector = self.entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _store(self, key: str, vector: List[float]):
+        with self._lock:
+            self.entries[key] = vector
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(key, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys = [normalize_query(text) for text in texts]
+        originals = {}
+        for key, text in zip(keys, texts):
+            originals.setdefault(key, text)
+        vectors = {key: self._lookup(key) for key in dict.fromkeys(keys)}
+
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([originals[key] for key in missing])
+            for key, vector in zip(missing, embedded):
+                vectors[key] = vector
+                self._store(key, vector)
+
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def precompute(self, queries: Iterable[str]):
+        originals = {}
+        for query in queries:
+            originals.setdefault(normalize_query(query), query)
+        with self._lock:
+            missing = [key for key in originals if key not in self.entries]
+        if not missing:
+            return
+        for key, vector in zip(missing, self.embeddings.embed_documents([originals[key] for key in missing])):
+            self._store(key, vector)
+        with self._lock:
+            self.precomputed += len(missing)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "precomputed": self.precomputed
+        }
+
+
+class EmbeddingRegistry:
+    # Models are keyed by name and backend: the ONNX variants produce vectors
+    # compatible with the torch index, but caches must not mix them.
+
+    def __init__(self):
+        self._models = {}
+        self._query_models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> Embeddings:
+        key = model_key(model_name, backend)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self._load(model_name, backend or EMBEDDING_BACKEND)
+            return self._models[key]
+
+    def get_query(self, model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> CachedQueryEmbeddings:
+        key = model_key(model_name, backend)
+        model = self._query_models.get(key)
+        if model is not None:
+            return model
+
+        embeddings = self.get(model_name, backend)
+        with self._lock:
+            if key not in self._query_models:
+                self._query_models[key] = CachedQueryEmbeddings(embeddings, key)
+            return self._query_models[key]
+
+    def _load(self, model_name: str, backend: str) -> Embeddings:
+        # Imported here so torch, transformers and onnxruntime load with the
+        # first model, not when the server module is imported.
+        from src.onnx_embeddings import create_embeddings
+
+        rss_before = _rss_kb()
+        start = time.perf_counter()
+
+        model = create_embeddings(model_name, backend)
+
+        key = model_key(model_name, backend)
+        self._stats[key] = {
+            "model_name": model_name,
+            "backend": backend,
+            "load_time_s": round(time.perf_counter() - start, 3),
+            "param_memory_mb": round(_model_bytes(model) / 1024 / 1024, 2),
+            "rss_delta_mb": round((_rss_kb() - rss_before) / 1024, 2),
+            "warmed_up": False,
+            "warmup_time_s": None,
+        }
+        return model
+
+    def warm_up(self, model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> Dict[str, Any]:
+        model = self.get(model_name, backend)
+
+        start = time.perf_counter()
+        model.embed_documents(WARMUP_TEXTS)
+        model.embed_query(WARMUP_TEXTS[0])
+
+        stats = self._stats[model_key(model_name, backend)]
+        stats["warmed_up"] = True
+        stats["warmup_time_s"] = round(time.perf_counter() - start, 3)
+        return stats
+
+    def is_loaded(self, model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> bool:
+        return model_key(model_name, backend) in self._models
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {name: dict(s) for name, s in self._stats.items()}
+        for name, model in self._query_models.items():
+            stats[name]["query_cache"] = model.stats()
+        return stats
+
+
+registry = EmbeddingRegistry()
+
+
+def get_embeddings(model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> Embeddings:
+    return registry.get(model_name, backend)
+
+
+def get_query_embeddings(model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> CachedQueryEmbeddings:
+    return registry.get_query(model_name, backend)
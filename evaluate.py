@@ -1,55 +1,158 @@
+import argparse
+import hashlib
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+from src.embeddings import DEFAULT_MODEL, model_key
 from src.ingestion import DocumentIngestion
 from src.qa_chain import QASystem
 
+SOURCE_FILE = "source.json"
+
+RETRIEVAL_STAGES = ("query_embedding", "vector_search", "lexical_search", "fusion", "context_build")
+
+DEFAULT_CASES = [
+    {
+        "question": "Who are the parties in this contract?",
+        "expected_keywords": ["ABC", "XYZ"]
+    },
+    {
+        "question": "What is the contract duration?",
+        "expected_keywords": ["12", "months"]
+    },
+    {
+        "question": "What is the total value?",
+        "expected_keywords": ["50,000", "$"]
+    },
+    {
+        "question": "What are the termination conditions?",
+        "expected_keywords": ["30", "notice"]
+    },
+    {
+        "question": "Who is responsible for damages?",
+        "expected_keywords": ["ABC"]
+    }
+]
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cases(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return DEFAULT_CASES
+
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f) or []
+            cases = data.get("cases", []) if isinstance(data, dict) else data
+        else:
+            cases = [json.loads(line) for line in f if line.strip()]
+
+    for case in cases:
+        if "question" not in case:
+            raise ValueError(f"Test case without a question in {path}: {case}")
+        case.setdefault("expected_keywords", [])
+    return cases
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    ordered = sorted(values)
+
+    def pick(pct):
+        return round(ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)], 3)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "mean": round(sum(ordered) / len(ordered), 3)}
+
+
+def ingestion_config(ingestion: DocumentIngestion) -> Dict[str, Any]:
+    return {
+        "chunk_size": ingestion.chunk_size,
+        "chunk_overlap": ingestion.chunk_overlap,
+        "index_type": ingestion.index_type,
+        "index_params": ingestion.index_params,
+        "embedding_model": model_key(DEFAULT_MODEL)
+    }
+
+
+def load_or_ingest(file_path: str, save_name: str, reindex: bool = False):
+    # The index is reused only if both the contract and the settings it was
+    # built with are unchanged; otherwise the eval would score a stale index.
+    ingestion = DocumentIngestion()
+    folder = os.path.join("vectorstore", save_name)
+    marker = os.path.join(folder, SOURCE_FILE)
+    digest = file_hash(file_path)
+    config = ingestion_config(ingestion)
+
+    if not reindex and os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("sha256") == digest and stored.get("config") == config:
+            vectorstore = ingestion.load_vectorstore(save_name)
+            if vectorstore is not None:
+                return vectorstore, True
+
+    vectorstore = ingestion.ingest_document(file_path, save_name)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"file": os.path.basename(file_path), "sha256": digest, "config": config}, f, indent=2)
+    return vectorstore, False
+
 
 class Evaluator:
 
-    def __init__(self, file_path: str):
-        ingestion = DocumentIngestion()
-        vectorstore = ingestion.ingest_document(file_path, "eval_doc")
+    def __init__(self, file_path: str, save_name: str = "eval_doc", reindex: bool = False,
+                 concurrency: int = 4, output: str = "evaluation_report.json"):
+        start = time.perf_counter()
+        vectorstore, self.index_reused = load_or_ingest(file_path, save_name, reindex)
+        self.index_s = time.perf_counter() - start
+
         self.qa = QASystem(vectorstore)
+        self.concurrency = max(concurrency, 1)
+        self.output = output
         self.results = []
+        self.wall_s = 0.0
 
-    def run(self):
-        test_cases = [
-            {
-                "question": "Who are the parties in this contract?",
-                "expected_keywords": ["ABC", "XYZ"]
-            },
-            {
-                "question": "What is the contract duration?",
-                "expected_keywords": ["12", "months"]
-            },
-            {
-                "question": "What is the total value?",
-                "expected_keywords": ["50,000", "$"]
-            },
-            {
-                "question": "What are the termination conditions?",
-                "expected_keywords": ["30", "notice"]
-            },
-            {
-                "question": "Who is responsible for damages?",
-                "expected_keywords": ["ABC"]
-            }
-        ]
-
-        for i, test in enumerate(test_cases, 1):
-            question = test["question"]
-            keywords = test["expected_keywords"]
+    def evaluate_case(self, test: Dict[str, Any]) -> Dict[str, Any]:
+        question = test["question"]
+        keywords = test["expected_keywords"]
 
+        try:
             result = self.qa.ask(question)
-            answer = result["answer"]
+        except Exception as e:
+            return {"question": question, "error": str(e), "metrics": None, "latency_ms": None}
+
+        answer = result["answer"]
+        timings = result.get("timings", {})
+
+        return {
+            "question": question,
+            "answer": answer,
+            "metrics": self.calculate_metrics(answer, keywords, result),
+            "latency_ms": {
+                "retrieval": round(sum(timings.get(stage, 0.0) for stage in RETRIEVAL_STAGES), 3),
+                "generation": timings.get("llm", 0.0),
+                "total": timings.get("total", 0.0)
+            }
+        }
 
-            metrics = self.calculate_metrics(answer, keywords, result)
+    def run(self, test_cases: List[Dict[str, Any]] = None):
+        test_cases = test_cases or DEFAULT_CASES
 
-            self.results.append({
-                "question": question,
-                "answer": answer,
-                "metrics": metrics
-            })
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            self.results = list(executor.map(self.evaluate_case, test_cases))
+        self.wall_s = time.perf_counter() - start
 
         self.print_summary()
         self.save_report()
@@ -73,42 +176,80 @@ class Evaluator:
             "quality": quality
         }
 
+    def _scored(self) -> List[Dict[str, Any]]:
+        return [r for r in self.results if r["metrics"] is not None]
+
+    def latency_summary(self) -> Dict[str, Any]:
+        scored = self._scored()
+        return {
+            "retrieval_ms": percentiles([r["latency_ms"]["retrieval"] for r in scored]),
+            "generation_ms": percentiles([r["latency_ms"]["generation"] for r in scored]),
+            "total_ms": percentiles([r["latency_ms"]["total"] for r in scored]),
+            "wall_s": round(self.wall_s, 3),
+            "questions_per_s": round(len(self.results) / self.wall_s, 2) if self.wall_s else 0.0,
+            "concurrency": self.concurrency,
+            "index_s": round(self.index_s, 3),
+            "index_reused": self.index_reused
+        }
+
     def print_summary(self):
-        total = len(self.results)
-        good = sum(1 for r in self.results if r["metrics"]["quality"] == "good")
-        avg_score = sum(r["metrics"]["keyword_score"] for r in self.results) / total
-        avg_sources = sum(r["metrics"]["num_sources"] for r in self.results) / total
+        scored = self._scored()
+        total = len(scored)
+        good = sum(1 for r in scored if r["metrics"]["quality"] == "good")
+        avg_score = sum(r["metrics"]["keyword_score"] for r in scored) / total if total else 0
+        avg_sources = sum(r["metrics"]["num_sources"] for r in scored) / total if total else 0
+        latency = self.latency_summary()
 
         print("\nEvaluation Summary")
         print("=" * 60)
-        print(f"Total Questions: {total}")
-        print(f"Good Answers: {good}/{total} ({good/total:.0%})")
+        print(f"Total Questions: {len(self.results)} ({len(self.results) - total} failed)")
+        print(f"Good Answers: {good}/{total} ({good/total if total else 0:.0%})")
         print(f"Average Accuracy: {avg_score:.0%}")
         print(f"Average Sources: {avg_sources:.1f}")
+        print(f"Retrieval p50/p95: {latency['retrieval_ms']['p50']:.1f} / {latency['retrieval_ms']['p95']:.1f} ms")
+        print(f"Generation p50/p95: {latency['generation_ms']['p50']:.1f} / {latency['generation_ms']['p95']:.1f} ms")
+        print(f"Throughput: {latency['questions_per_s']:.2f} questions/s at concurrency {self.concurrency}")
+        print(f"Index: {'reused' if self.index_reused else 'built'} in {self.index_s:.2f}s")
         print("=" * 60)
 
     def save_report(self):
-        total = len(self.results)
-        good = sum(1 for r in self.results if r["metrics"]["quality"] == "good")
-        avg_score = sum(r["metrics"]["keyword_score"] for r in self.results) / total
+        scored = self._scored()
+        total = len(scored)
+        good = sum(1 for r in scored if r["metrics"]["quality"] == "good")
+        avg_score = sum(r["metrics"]["keyword_score"] for r in scored) / total if total else 0
 
         report = {
             "timestamp": datetime.now().isoformat(),
             "summary": {
-                "total_questions": total,
+                "total_questions": len(self.results),
+                "failed_questions": len(self.results) - total,
                 "good_answers": good,
-                "success_rate": round(good/total, 2),
+                "success_rate": round(good/total, 2) if total else 0.0,
                 "avg_keyword_score": round(avg_score, 2)
             },
+            "latency": self.latency_summary(),
             "detailed_results": self.results
         }
 
-        with open("evaluation_report.json", "w", encoding="utf-8") as f:
+        with open(self.output, "w", encoding="utf-8") as f:
             json.dump(report, f, ensure_ascii=False, indent=2)
 
-        print("\nReport saved: evaluation_report.json")
+        print(f"\nReport saved: {self.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer quality and latency evaluation")
+    parser.add_argument("--file", default="data/test_contract.pdf")
+    parser.add_argument("--cases", default=None, help="JSONL or YAML file of question/expected_keywords cases")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("EVAL_CONCURRENCY", "4")))
+    parser.add_argument("--save-name", default="eval_doc")
+    parser.add_argument("--reindex", action="store_true", help="Rebuild the index even if the file is unchanged")
+    parser.add_argument("--output", default="evaluation_report.json")
+    args = parser.parse_args()
+
+    evaluator = Evaluator(args.file, args.save_name, args.reindex, args.concurrency, args.output)
+    evaluator.run(load_cases(args.cases))
 
 
 if __name__ == "__main__":
-    evaluator = Evaluator("data/test_contract.pdf")
-    evaluator.run()
\ No newline at end of file
+    main()
@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+DEFAULT_SESSION = "default"
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "100"))
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "10000"))
+HISTORY_IDLE_TTL = float(os.getenv("HISTORY_IDLE_TTL", "3600"))
+HISTORY_SPILL_PATH = os.getenv("HISTORY_SPILL_PATH", "")
+SWEEP_INTERVAL = 60.0
+
+
+def turn_bytes(turn: Dict[str, Any]) -> int:
+    return sys.getsizeof(turn) + sum(sys.getsizeof(value) for value in turn.values())
+
+
+class Session:
+
+    def __init__(self, max_turns: int):
+        self.turns = deque(maxlen=max_turns)
+        self.next_seq = 0
+        self.bytes = 0
+        self.last_access = time.time()
+
+
+class HistoryStore:
+    # Each session keeps its latest turns in a ring buffer. With a spill path,
+    # turns pushed out of the buffer (or left by an evicted session) move to
+    # SQLite and stay pageable; without one they are dropped.
+
+    def __init__(self, max_turns: int = HISTORY_MAX_TURNS, max_sessions: int = HISTORY_MAX_SESSIONS,
+                 idle_ttl_seconds: float = HISTORY_IDLE_TTL, spill_path: Optional[str] = HISTORY_SPILL_PATH or None):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl_seconds
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.evictions = 0
+        self.spilled = 0
+        self.dropped = 0
+
+        self.conn = None
+        if spill_path:
+            if os.path.dirname(spill_path):
+                os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+            self.conn = sqlite3.connect(spill_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, document_id TEXT, question TEXT NOT NULL, "
+                "answer TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (session_id, seq))"
+            )
+            self.conn.commit()
+
+    def _spill(self, session_id: str, turns: List[Dict[str, Any]]):
+        if not turns:
+            return
+        if self.conn is None:
+            self.dropped += len(turns)
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id, t["seq"], t["document_id"], t["question"], t["answer"], t["created_at"]) for t in turns]
+        )
+        self.conn.commit()
+        self.spilled += len(turns)
+
+    def _spilled_count(self, session_id: str) -> int:
+        if self.conn is None:
+            return 0
+        return self.conn.execute("SELECT COUNT(*) FROM history WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def _session(self, session_id: str, create: bool) -> Optional[Session]:
+        session = self.sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self.sessions[session_id] = Session(self.max_turns)
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT MAX(seq) FROM history WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                session.next_seq = row[0] + 1 if row[0] is not None else 0
+        session.last_access = time.time()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def _evict(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        self._spill(session_id, list(session.turns))
+        self.evictions += 1
+
+    def _sweep(self):
+        now = time.time()
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and now - session.last_access < self.idle_ttl:
+                break
+            self._evict(session_id)
+        self._last_sweep = now
+
+    def append(self, session_id: str, question: str, answer: str, document_id: Optional[str] = None):
+        with self._lock:
+            session = self._session(session_id, create=True)
+            turn = {
+                "seq": session.next_seq,
+                "document_id": document_id,
+                "question": question,
+                "answer": answer,
+                "created_at": time.time()
+            }
+            session.next_seq += 1
+
+            if len(session.turns) == session.turns.maxlen:
+                oldest = session.turns[0]
+                session.bytes -= turn_bytes(oldest)
+                self._spill(session_id, [oldest])
+            session.turns.append(turn)
+            session.bytes += turn_bytes(turn)
+
+            if len(self.sessions) > self.max_sessions or time.time() - self._last_sweep > SWEEP_INTERVAL:
+                self._sweep()
+
+    def page(self, session_id: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            session = self._session(session_id, create=False)
+            memory = list(session.turns) if session else []
+            spilled = self._spilled_count(session_id)
+
+            # Spilled turns are always older than the ones still in memory.
+            items = []
+            if offset < spilled:
+                rows = self.conn.execute(
+                    "SELECT seq, document_id, question, answer, created_at FROM history "
+                    "WHERE session_id = ? ORDER BY seq LIMIT ? OFFSET ?", (session_id, limit, offset)
+                ).fetchall()
+                items = [
+                    {"seq": r[0], "document_id": r[1], "question": r[2], "answer": r[3], "created_at": r[4]}
+                    for r in rows
+                ]
+
+            start = max(offset - spilled, 0)
+            items.extend(memory[start:start + limit - len(items)])
+
+        return {
+            "session_id": session_id,
+            "history": items,
+            "total": spilled + len(memory),
+            "offset": offset,
+            "limit": limit
+        }
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+                self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._sweep()
+            memory_bytes = sum(session.bytes for session in self.sessions.values())
+            return {
+                "sessions": len(self.sessions),
+                "turns_in_memory": sum(len(session.turns) for session in self.sessions.values()),
+                "memory_mb": round(memory_bytes / 1024 / 1024, 3),
+                "max_turns_per_session": self.max_turns,
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl,
+                "evicted_sessions": self.evictions,
+                "spilled_turns": self.spilled,
+                "dropped_turns": self.dropped,
+                "spill": self.conn is not None
+            }
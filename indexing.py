@@ -0,0 +1,339 @@
+import argparse
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+STORAGE_TYPES = ("float32", "float16", "sq8")
+CONFIG_FILE = "index_config.json"
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+FOOTPRINT_FILE = "footprint.json"
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+
+DEFAULT_PARAMS = {
+    "nlist": None,
+    "nprobe": 8,
+    "hnsw_m": 32,
+    "ef_construction": 80,
+    "ef_search": 64,
+    "pq_m": 16,
+    "pq_bits": 8,
+    "train_size": 20000,
+    "storage": "float32"
+}
+
+CODECS = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8"}
+
+
+def resolve_params(index_type: str, num_vectors: int, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    resolved = dict(DEFAULT_PARAMS, **(params or {}))
+    resolved["index_type"] = index_type
+    if resolved["storage"] not in STORAGE_TYPES:
+        raise ValueError(f"Unknown index storage: {resolved['storage']}")
+    if index_type == "ivfpq":
+        # Product quantization is already compressed; storage does not apply.
+        resolved["storage"] = "float32"
+
+    if index_type in ("ivf", "ivfpq"):
+        nlist = resolved["nlist"] or int(4 * math.sqrt(num_vectors))
+        # Faiss wants roughly 39 training points per centroid.
+        nlist = min(nlist, num_vectors // 39)
+        min_points = 2 ** resolved["pq_bits"] if index_type == "ivfpq" else 0
+        if nlist < 4 or num_vectors < min_points:
+            resolved["index_type"] = "flat"
+            resolved["fallback_reason"] = f"{num_vectors} vectors is too few to train {index_type}"
+        resolved["nlist"] = nlist
+
+    return resolved
+
+
+def factory_string(params: Dict[str, Any]) -> str:
+    index_type = params["index_type"]
+    codec = CODECS[params.get("storage", "float32")]
+    if index_type == "flat":
+        return codec
+    if index_type == "ivf":
+        return f"IVF{params['nlist']},{codec}"
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']}" if codec == "Flat" else f"HNSW{params['hnsw_m']},{codec}"
+    return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_bits']}"
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]):
+    space = faiss.ParameterSpace()
+    if params["index_type"] in ("ivf", "ivfpq"):
+        space.set_index_parameter(index, "nprobe", params["nprobe"])
+    elif params["index_type"] == "hnsw":
+        space.set_index_parameter(index, "efSearch", params["ef_search"])
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat",
+                params: Optional[Dict[str, Any]] = None, metric: int = faiss.METRIC_L2):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    resolved = resolve_params(index_type, len(vectors), params)
+
+    index = faiss.index_factory(vectors.shape[1], factory_string(resolved), metric)
+
+    if resolved["index_type"] == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = resolved["ef_construction"]
+
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > resolved["train_size"]:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(len(vectors), resolved["train_size"], replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    apply_search_params(index, resolved)
+    return index, resolved
+
+
+def flat_index(vectors: np.ndarray, metric: int = faiss.METRIC_L2) -> faiss.Index:
+    index = faiss.IndexFlat(vectors.shape[1], metric)
+    index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    return index
+
+
+def extract_vectors(index: faiss.Index) -> np.ndarray:
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def is_compressed(params: Optional[Dict[str, Any]]) -> bool:
+    return params is not None and params.get("storage", "float32") != "float32"
+
+
+def rescore(vectors: np.ndarray, queries: np.ndarray, candidates: np.ndarray, k: int,
+            metric: int = faiss.METRIC_L2):
+    # Candidates from the compressed index are re-ranked with the full float32
+    # vectors. Only the candidate rows are read, so a memory-mapped file works.
+    distances = np.full((len(queries), k), np.inf if metric == faiss.METRIC_L2 else -np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, (query, row) in enumerate(zip(queries, candidates)):
+        row = np.sort(row[row >= 0])
+        if not len(row):
+            continue
+        exact = np.asarray(vectors[row], dtype=np.float32)
+        if metric == faiss.METRIC_L2:
+            scores = ((exact - query) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:k]
+        else:
+            scores = exact @ query
+            order = np.argsort(-scores)[:k]
+        distances[i, :len(order)] = scores[order]
+        ids[i, :len(order)] = row[order]
+    return distances, ids
+
+
+def supports_remove(params: Optional[Dict[str, Any]]) -> bool:
+    # Only flat indexes shift later ids down on removal, which is what
+    # LangChain's delete assumes when it renumbers index_to_docstore_id.
+    # IVF keeps the stored ids and HNSW cannot remove at all.
+    return params is None or params["index_type"] == "flat"
+
+
+def write_index(index: faiss.Index, folder: str):
+    # Replaced atomically so processes that mapped the old file are unaffected.
+    path = os.path.join(folder, INDEX_FILE)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def read_index(folder: str, mmap: bool = True) -> faiss.Index:
+    path = os.path.join(folder, INDEX_FILE)
+    if mmap:
+        # IO_FLAG_MMAP_IFC (faiss >= 1.8) also maps flat codes, not just IVF lists.
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def write_vectors(vectors: np.ndarray, folder: str):
+    path = os.path.join(folder, VECTORS_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(path + ".tmp", path)
+
+
+def read_vectors(folder: str, mmap: bool = True) -> Optional[np.ndarray]:
+    path = os.path.join(folder, VECTORS_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def _file_mb(folder: str, name: str) -> float:
+    path = os.path.join(folder, name)
+    return os.path.getsize(path) / 1024 / 1024 if os.path.exists(path) else 0.0
+
+
+def footprint(folder: str, index: faiss.Index, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # The index codes are what a worker keeps resident per document; rescoring
+    # vectors, chunk text and BM25 stay on disk and are paged in on demand.
+    names = [name for name in os.listdir(folder) if not name.endswith(".tmp") and name != FOOTPRINT_FILE]
+    files = {name: _file_mb(folder, name) for name in names}
+    index_mb = files.get(INDEX_FILE, 0.0)
+    float32_mb = index.ntotal * index.d * 4 / 1024 / 1024
+    return {
+        "num_vectors": index.ntotal,
+        "dim": index.d,
+        "storage": (params or {}).get("storage", "float32"),
+        "resident_mb": round(index_mb, 3),
+        "float32_vectors_mb": round(float32_mb, 3),
+        "compression": round(float32_mb / index_mb, 2) if index_mb else 0.0,
+        "bytes_per_vector": round(index_mb * 1024 * 1024 / index.ntotal, 1) if index.ntotal else 0.0,
+        "disk_mb": round(sum(files.values()), 3),
+        "files_mb": {name: round(size, 3) for name, size in sorted(files.items())}
+    }
+
+
+def save_footprint(folder: str, index: faiss.Index, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    report = footprint(folder, index, params)
+    with open(os.path.join(folder, FOOTPRINT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def load_footprint(folder: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(folder, FOOTPRINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_config(folder: str, params: Dict[str, Any]):
+    with open(os.path.join(folder, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+
+
+def load_config(folder: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(folder, CONFIG_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return round(float(np.percentile(values, pct)), 3) if values else 0.0
+
+
+def compare_index_configs(vectors: np.ndarray, queries: np.ndarray, configs: List[Dict[str, Any]],
+                          k: int = 10) -> Dict[str, Any]:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, truth = baseline.search(queries, k)
+
+    report = {"num_vectors": len(vectors), "num_queries": len(queries), "k": k, "results": []}
+
+    for config in [{"index_type": "flat"}] + configs:
+        params = {key: value for key, value in config.items() if key != "index_type"}
+
+        start = time.perf_counter()
+        index, resolved = build_index(vectors, config["index_type"], params)
+        build_s = time.perf_counter() - start
+
+        compressed = is_compressed(resolved)
+        latencies = []
+        found = np.zeros_like(truth)
+        raw = np.zeros_like(truth)
+        for i, query in enumerate(queries):
+            query = query.reshape(1, -1)
+            start = time.perf_counter()
+            _, ids = index.search(query, k * RESCORE_FACTOR if compressed else k)
+            if compressed:
+                _, ids = rescore(vectors, query, ids, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found[i] = ids[0][:k]
+            if compressed:
+                raw[i] = index.search(query, k)[1][0]
+
+        hits = sum(len(set(found[i]) & set(truth[i])) for i in range(len(queries)))
+        if compressed:
+            raw_hits = sum(len(set(raw[i]) & set(truth[i])) for i in range(len(queries)))
+        report["results"].append({
+            "config": resolved,
+            "factory": factory_string(resolved),
+            "build_s": round(build_s, 3),
+            "recall_at_k": round(hits / truth.size, 4),
+            "recall_at_k_without_rescore": round(raw_hits / truth.size, 4) if compressed else None,
+            "latency_ms_p50": _percentile(latencies, 50),
+            "latency_ms_p95": _percentile(latencies, 95),
+            "latency_ms_p99": _percentile(latencies, 99),
+            "index_bytes": faiss.serialize_index(index).nbytes
+        })
+
+    return report
+
+
+def default_configs() -> List[Dict[str, Any]]:
+    return [
+        {"index_type": "flat", "storage": "float16"},
+        {"index_type": "flat", "storage": "sq8"},
+        {"index_type": "ivf", "nprobe": 4},
+        {"index_type": "ivf", "nprobe": 16},
+        {"index_type": "hnsw", "ef_search": 32},
+        {"index_type": "hnsw", "ef_search": 128},
+        {"index_type": "hnsw", "ef_search": 64, "storage": "sq8"},
+        {"index_type": "ivfpq", "nprobe": 16}
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency report for FAISS index types")
+    parser.add_argument("--vectorstore", help="Name of a saved index under ./vectorstore")
+    parser.add_argument("--synthetic", type=int, default=100000, help="Number of random vectors if no index given")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", default="index_report.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    if args.vectorstore:
+        index = read_index(os.path.join("vectorstore", args.vectorstore), mmap=False)
+        vectors = extract_vectors(index)
+    else:
+        vectors = rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+        faiss.normalize_L2(vectors)
+
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.01, (len(picks), vectors.shape[1])).astype(np.float32)
+
+    report = compare_index_configs(vectors, queries, default_configs(), k=args.k)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'Index':<22}{'Recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'Build s':>10}{'MB':>10}")
+    print("=" * 72)
+    for result in report["results"]:
+        print(f"{result['factory']:<22}{result['recall_at_k']:>10.3f}{result['latency_ms_p50']:>10.3f}"
+              f"{result['latency_ms_p95']:>10.3f}{result['build_s']:>10.2f}"
+              f"{result['index_bytes'] / 1024 / 1024:>10.2f}")
+    print(f"\nReport saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,430 @@
+import multiprocessing
 import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import PyPDF2
 from docx import Document
-from typing import List
+from typing import Callable, Iterator, List, Optional, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document as LangChainDocument
+from src.chunk_store import ChunkStore, LEGACY_FILE, iter_documents
+from src.embedding_cache import CachedEmbeddings, get_embedding_cache
+from src.embeddings import get_embeddings
+from src.lexical import BM25Index, BM25Store, build_from_vectorstore
+from src.logger import get_logger, log_event
+from src.metrics import span, timed, track
+from src.indexing import (
+    CONFIG_FILE, VECTORS_FILE, apply_search_params, build_index, extract_vectors, flat_index, is_compressed,
+    load_config, read_index, read_vectors, save_config, save_footprint, supports_remove, write_index, write_vectors
+)
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = 8
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "float32")
+PARALLEL_MIN_PAGES = 32
+
+logger = get_logger("ingestion")
+
+_extract_pool = None
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+
+def index_lock(save_name: str) -> threading.RLock:
+    # Edits load, modify and rewrite ./vectorstore/<name>; one lock per index
+    # keeps concurrent writers from dropping each other's changes.
+    with _index_locks_guard:
+        return _index_locks.setdefault(save_name, threading.RLock())
+
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extract_pool
+
+
+def extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(i + 1, pdf_reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def iter_pdf_pages(pdf_path: str, workers: int = EXTRACT_WORKERS) -> Iterator[Tuple[int, str]]:
+    with open(pdf_path, 'rb') as file:
+        num_pages = len(PyPDF2.PdfReader(file).pages)
+
+    if workers <= 1 or num_pages < PARALLEL_MIN_PAGES:
+        for start in range(0, num_pages, PAGES_PER_TASK):
+            yield from extract_pdf_page_range(pdf_path, start, min(start + PAGES_PER_TASK, num_pages))
+        return
+
+    pool = _get_extract_pool()
+    ranges = iter(range(0, num_pages, PAGES_PER_TASK))
+    pending = deque()
+
+    # Keep a bounded number of page ranges in flight and yield them in page order.
+    for start in ranges:
+        pending.append(pool.submit(extract_pdf_page_range, pdf_path, start, min(start + PAGES_PER_TASK, num_pages)))
+        if len(pending) >= workers * 2:
+            break
+
+    while pending:
+        pages = pending.popleft().result()
+        next_start = next(ranges, None)
+        if next_start is not None:
+            pending.append(pool.submit(
+                extract_pdf_page_range, pdf_path, next_start, min(next_start + PAGES_PER_TASK, num_pages)
+            ))
+        yield from pages
+
+
+def iter_docx_pages(docx_path: str) -> Iterator[Tuple[int, str]]:
+    doc = Document(docx_path)
+    page = 1
+    lines = []
+    for para in doc.paragraphs:
+        lines.append(para.text)
+        if 'w:type="page"' in para._p.xml:
+            yield page, "\n".join(lines)
+            page += 1
+            lines = []
+    if lines:
+        yield page, "\n".join(lines)
+
+
+def iter_batches(items: Iterator, batch_size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 class DocumentIngestion:
     
-    def __init__(self, chunk_size=800, chunk_overlap=150):
+    def __init__(self, chunk_size=800, chunk_overlap=150, embeddings=None, embed_batch_size=64,
+                 use_cache=True, embedding_backend=None, extract_workers=EXTRACT_WORKERS, index_type=INDEX_TYPE,
+                 index_params=None, storage=INDEX_STORAGE):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.extract_workers = extract_workers
+        self.index_type = index_type
+        self.index_params = {"storage": storage, **(index_params or {})}
+        self.index_config = None
+        self.footprint = None
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
         )
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
+        self.embeddings = embeddings or get_embeddings(backend=embedding_backend)
+        self.document_embeddings = (
+            CachedEmbeddings(self.embeddings, get_embedding_cache()) if use_cache else self.embeddings
         )
         self.vectorstore = None
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
+    def extract_text_from_pdf(self, pdf_path: str, on_progress: Optional[Callable] = None) -> str:
+        pages = []
+        for page_no, text in iter_pdf_pages(pdf_path, self.extract_workers):
+            pages.append(text)
+            if on_progress:
+                on_progress("pages_extracted", page_no)
+        return "\n".join(pages).strip()
 
     def extract_text_from_docx(self, docx_path: str) -> str:
         doc = Document(docx_path)
         return "\n".join([para.text for para in doc.paragraphs])
 
-    def process_document(self, file_path: str) -> List[LangChainDocument]:
+    def iter_pages(self, file_path: str) -> Iterator[Tuple[int, str]]:
         if file_path.endswith('.pdf'):
-            text = self.extract_text_from_pdf(file_path)
+            return iter_pdf_pages(file_path, self.extract_workers)
         elif file_path.endswith(('.docx', '.doc')):
-            text = self.extract_text_from_docx(file_path)
-        else:
-            raise ValueError("Unsupported file type")
+            return iter_docx_pages(file_path)
+        raise ValueError("Unsupported file type")
+
+    def iter_chunks(self, file_path: str, on_progress: Optional[Callable] = None) -> Iterator[LangChainDocument]:
+        source = os.path.basename(file_path)
+        chunk_id = 0
+        carry, carry_page = "", None
+
+        # The last chunk of each page is carried into the next one so clauses
+        # spanning a page break are split the same way as in the full text.
+        for page_no, page_text in self.iter_pages(file_path):
+            if on_progress:
+                on_progress("pages_extracted", page_no)
+
+            text = f"{carry}\n{page_text}" if carry else page_text
+            chunks = self.text_splitter.split_text(text)
+            if not chunks:
+                continue
+
+            offset = 0
+            pages = []
+            for chunk in chunks:
+                position = text.find(chunk, offset)
+                offset = max(position, offset)
+                pages.append(carry_page if carry and 0 <= position < len(carry) else page_no)
 
-        chunks = self.text_splitter.split_text(text)
+            for chunk, page in zip(chunks[:-1], pages[:-1]):
+                yield LangChainDocument(
+                    page_content=chunk,
+                    metadata={"source": source, "chunk_id": chunk_id, "page": page}
+                )
+                chunk_id += 1
 
-        return [
-            LangChainDocument(
-                page_content=chunk,
-                metadata={"source": os.path.basename(file_path), "chunk_id": i}
+            carry, carry_page = chunks[-1], pages[-1]
+
+        if carry:
+            yield LangChainDocument(
+                page_content=carry,
+                metadata={"source": source, "chunk_id": chunk_id, "page": carry_page}
             )
-            for i, chunk in enumerate(chunks)
-        ]
 
-    def ingest_document(self, file_path: str, save_name: str = "default") -> FAISS:
-        documents = self.process_document(file_path)
-        
-        self.vectorstore = FAISS.from_documents(documents, self.embeddings)
-        
+    def process_document(self, file_path: str, on_progress: Optional[Callable] = None) -> List[LangChainDocument]:
+        return list(self.iter_chunks(file_path, on_progress))
+
+    def embed_documents(self, documents: List[LangChainDocument],
+                        on_progress: Optional[Callable] = None) -> List[List[float]]:
+        vectors = []
+        for batch in iter_batches(iter(documents), self.embed_batch_size):
+            vectors.extend(self.document_embeddings.embed_documents([doc.page_content for doc in batch]))
+            if on_progress:
+                on_progress("chunks_embedded", len(vectors))
+        return vectors
+
+    def _stream_into_vectorstore(self, file_path: str, vectorstore: Optional[FAISS],
+                                 on_progress: Optional[Callable] = None) -> FAISS:
+        embedded = 0
+        chunks = timed(self.iter_chunks(file_path, on_progress), "extract_chunk")
+        for batch in iter_batches(chunks, self.embed_batch_size):
+            with span("embed"):
+                vectors = self.document_embeddings.embed_documents([doc.page_content for doc in batch])
+            text_embeddings = [(doc.page_content, vector) for doc, vector in zip(batch, vectors)]
+            metadatas = [doc.metadata for doc in batch]
+
+            with span("index_add"):
+                if vectorstore is None:
+                    vectorstore = FAISS.from_embeddings(
+                        text_embeddings, self.embeddings, metadatas=metadatas, ids=self.document_ids(batch)
+                    )
+                else:
+                    vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=self.document_ids(batch))
+
+            embedded += len(batch)
+            if on_progress:
+                on_progress("chunks_total", embedded)
+                on_progress("chunks_embedded", embedded)
+
+        if vectorstore is None:
+            raise ValueError("No text could be extracted from the document")
+        return vectorstore
+
+    @staticmethod
+    def document_ids(documents: List[LangChainDocument]) -> List[str]:
+        return [f"{doc.metadata['source']}:{doc.metadata['chunk_id']}" for doc in documents]
+
+    def save_vectorstore(self, save_name: str, on_progress: Optional[Callable] = None):
         os.makedirs("vectorstore", exist_ok=True)
-        self.vectorstore.save_local(f"./vectorstore/{save_name}")
-        
+        path = f"./vectorstore/{save_name}"
+        os.makedirs(path, exist_ok=True)
+        exact_vectors = getattr(self.vectorstore, "exact_vectors", None)
+        # An index loaded for editing only writes its changed chunks and
+        # postings; a new one is written whole.
+        docstore = self.vectorstore.docstore
+        changes = None
+        with span("save"):
+            write_index(self.vectorstore.index, path)
+            if exact_vectors is not None:
+                write_vectors(exact_vectors, path)
+            elif os.path.exists(os.path.join(path, VECTORS_FILE)):
+                os.remove(os.path.join(path, VECTORS_FILE))
+            if isinstance(docstore, ChunkStore) and os.path.samefile(docstore.folder, path):
+                ids = [doc_id for _, doc_id in sorted(self.vectorstore.index_to_docstore_id.items())]
+                changes = docstore.commit(ids)
+            else:
+                ChunkStore.write(path, iter_documents(self.vectorstore))
+        # Chunk text and rescoring vectors now live on disk; drop the in-memory copies.
+        self.vectorstore.docstore = ChunkStore(path)
+        if exact_vectors is not None:
+            self.vectorstore.exact_vectors = read_vectors(path)
+
+        lexical_index = BM25Index.load(path) if changes is not None else None
+        if isinstance(lexical_index, BM25Store):
+            removed, added = changes
+            with span("bm25_update"):
+                lexical_index.update(((doc_id, doc.page_content) for doc_id, doc in added), removed)
+        else:
+            with span("bm25_build"):
+                build_from_vectorstore(self.vectorstore).save(path)
+            lexical_index = BM25Index.load(path)
+        self.vectorstore.lexical_index = lexical_index
+        if self.index_config:
+            save_config(path, self.index_config)
+        elif os.path.exists(os.path.join(path, CONFIG_FILE)):
+            # A plain float32 flat index has no config; a stale one would make
+            # load_vectorstore apply old search params or expect vectors.npy.
+            os.remove(os.path.join(path, CONFIG_FILE))
+        self.footprint = save_footprint(path, self.vectorstore.index, self.index_config)
+        if on_progress:
+            on_progress("index_written", True)
+
+    def _build(self, index_type: str, params: dict):
+        with span("index_build"):
+            vectors = extract_vectors(self.vectorstore.index)
+            self.vectorstore.index, self.index_config = build_index(vectors, index_type, params)
+        # Compressed codes are rescored against the exact vectors, saved alongside.
+        self.vectorstore.exact_vectors = vectors if is_compressed(self.index_config) else None
+
+    def _convert_index(self):
+        # Chunks stream into a flat float32 index; approximate and compressed
+        # indexes are built once every vector is known, keeping the docstore id order intact.
+        if self.index_type == "flat" and not is_compressed(self.index_params):
+            self.index_config = None
+            return
+        self._build(self.index_type, self.index_params)
+
+    def _recompress(self):
+        # Compressed indexes are edited as exact flat indexes, then rebuilt
+        # (retraining the quantizer) before they are saved.
+        if is_compressed(self.index_config):
+            params = {key: value for key, value in self.index_config.items() if key != "index_type"}
+            self._build(self.index_config["index_type"], params)
+
+    def ingest_document(self, file_path: str, save_name: str = "default",
+                        on_progress: Optional[Callable] = None) -> FAISS:
+        with index_lock(save_name), track("ingest") as timings:
+            vectorstore = self._ingest(file_path, save_name, on_progress)
+        self._log("ingest", file_path, save_name, timings)
+        return vectorstore
+
+    def _log(self, operation: str, file_path: str, save_name: str, timings: dict):
+        log_event(logger, operation, file=os.path.basename(file_path), save_name=save_name,
+                  vectors=self.vectorstore.index.ntotal, index_config=self.index_config,
+                  footprint=self.footprint, timings=timings)
+
+    def _ingest(self, file_path: str, save_name: str, on_progress: Optional[Callable]) -> FAISS:
+        self.vectorstore = self._stream_into_vectorstore(file_path, None, on_progress)
+        self._convert_index()
+        self.save_vectorstore(save_name, on_progress)
         return self.vectorstore
 
-    def load_vectorstore(self, name: str = "default") -> FAISS:
+    def _delete_ids(self, ids: List[str]):
+        if supports_remove(self.index_config) or is_compressed(self.index_config):
+            self.vectorstore.delete(ids)
+            return
+
+        # IVF and HNSW indexes are rebuilt from the surviving vectors.
+        drop = set(ids)
+        vectors = extract_vectors(self.vectorstore.index)
+        keep = [i for i, doc_id in sorted(self.vectorstore.index_to_docstore_id.items()) if doc_id not in drop]
+        kept_ids = [self.vectorstore.index_to_docstore_id[i] for i in keep]
+
+        params = {key: value for key, value in self.index_config.items() if key != "index_type"}
+        self.vectorstore.index, self.index_config = build_index(
+            vectors[keep], self.index_config["index_type"], params
+        )
+        self.vectorstore.docstore.delete(ids)
+        self.vectorstore.index_to_docstore_id = dict(enumerate(kept_ids))
+
+    def source_ids(self, source: str) -> List[str]:
+        return self.vectorstore.docstore.ids_for_source(source)
+
+    def list_sources(self, save_name: str = "default") -> List[str]:
+        self.vectorstore = self.load_vectorstore(save_name)
+        if self.vectorstore is None:
+            return []
+        return self.vectorstore.docstore.sources()
+
+    def add_document(self, file_path: str, save_name: str = "default",
+                     on_progress: Optional[Callable] = None) -> FAISS:
+        with index_lock(save_name), track("add_document") as timings:
+            vectorstore = self._add(file_path, save_name, on_progress)
+        self._log("add_document", file_path, save_name, timings)
+        return vectorstore
+
+    def _add(self, file_path: str, save_name: str, on_progress: Optional[Callable]) -> FAISS:
+        self.vectorstore = self.load_vectorstore(save_name, mmap=False)
+        if self.vectorstore is None:
+            return self._ingest(file_path, save_name, on_progress)
+
+        stale_ids = self.source_ids(os.path.basename(file_path))
+        if stale_ids:
+            self._delete_ids(stale_ids)
+        self.vectorstore = self._stream_into_vectorstore(file_path, self.vectorstore, on_progress)
+
+        self._recompress()
+        self.save_vectorstore(save_name, on_progress)
+        return self.vectorstore
+
+    def replace_document(self, file_path: str, save_name: str = "default",
+                         on_progress: Optional[Callable] = None) -> FAISS:
+        return self.add_document(file_path, save_name, on_progress)
+
+    def remove_document(self, source: str, save_name: str = "default") -> Optional[FAISS]:
+        with index_lock(save_name):
+            return self._remove(source, save_name)
+
+    def _remove(self, source: str, save_name: str) -> Optional[FAISS]:
+        self.vectorstore = self.load_vectorstore(save_name, mmap=False)
+        if self.vectorstore is None:
+            return None
+
+        ids = self.source_ids(source)
+        if not ids:
+            return self.vectorstore
+        if len(ids) == len(self.vectorstore.index_to_docstore_id):
+            raise ValueError("Cannot remove the last document from an index")
+
+        self._delete_ids(ids)
+        self._recompress()
+        self.save_vectorstore(save_name)
+        log_event(logger, "remove_document", source=source, save_name=save_name, removed=len(ids),
+                  vectors=self.vectorstore.index.ntotal)
+        return self.vectorstore
+
+    def load_vectorstore(self, name: str = "default", mmap: bool = True) -> FAISS:
+        # Only the index is mapped and the chunk ids read; chunk text stays in
+        # chunks.sqlite until a search asks for it. Editing needs mmap=False.
         path = f"./vectorstore/{name}"
         if not os.path.exists(path):
             return None
-        return FAISS.load_local(path, self.embeddings, allow_dangerous_deserialization=True)
\ No newline at end of file
+        if not ChunkStore.exists(path):
+            if os.path.exists(os.path.join(path, LEGACY_FILE)):
+                raise ValueError(f"Index '{name}' uses the old pickle format; run python -m src.chunk_store {name}")
+            return None
+
+        index = read_index(path, mmap)
+        self.index_config = load_config(path)
+        exact_vectors = read_vectors(path, mmap) if is_compressed(self.index_config) else None
+        editing_exact = exact_vectors is not None and not mmap
+        if editing_exact:
+            # The working copy is exact, so it needs no rescoring until rebuilt.
+            index = flat_index(exact_vectors, index.metric_type)
+            exact_vectors = None
+
+        docstore = ChunkStore(path)
+        vectorstore = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(docstore.ids()))
+        )
+        vectorstore.lexical_index = BM25Index.load(path)
+        vectorstore.exact_vectors = exact_vectors
+        if self.index_config and not editing_exact:
+            apply_search_params(vectorstore.index, self.index_config)
+        return vectorstore
\ No newline at end of file
@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
+from src.ingestion import DocumentIngestion, index_lock
+from src.logger import get_logger, get_request_id, reset_request_id, set_request_id
+
+logger = get_logger("jobs")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class IngestionJob:
+
+    def __init__(self, file_path: str, save_name: str, mode: str = "create"):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.save_name = save_name
+        self.mode = mode
+        # Ingestion logs carry the id of the upload request that queued the job.
+        self.request_id = get_request_id()
+        self.status = "queued"
+        self.progress = {
+            "pages_extracted": 0,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "index_written": False
+        }
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, stage: str, value):
+        self.progress[stage] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+
+        return {
+            "job_id": self.id,
+            "save_name": self.save_name,
+            "mode": self.mode,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "queued_s": round((self.started_at or time.time()) - self.created_at, 3),
+            "elapsed_s": elapsed
+        }
+
+
+class IngestionJobQueue:
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, max_retained: int = 200):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_retained = max_retained
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def _active(self) -> int:
+        return sum(1 for job in list(self.jobs.values()) if job.status in ("queued", "running"))
+
+    def is_full(self) -> bool:
+        return self._active() >= self.max_workers + self.max_pending
+
+    def submit(self, file_path: str, save_name: str, on_complete: Optional[Callable] = None,
+               mode: str = "create") -> IngestionJob:
+        with self._lock:
+            if self.is_full():
+                raise JobQueueFull("Ingestion queue is full, retry later")
+
+            job = IngestionJob(file_path, save_name, mode)
+            self.jobs[job.id] = job
+            self._prune()
+
+        self.executor.submit(self._run, job, on_complete)
+        return job
+
+    def _run(self, job: IngestionJob, on_complete: Optional[Callable]):
+        job.status = "running"
+        job.started_at = time.time()
+        token = set_request_id(job.request_id)
+
+        try:
+            # The lock also covers on_complete, so the registry is updated in
+            # the same order the index was written.
+            with index_lock(job.save_name):
+                ingestion = DocumentIngestion()
+                if job.mode == "add":
+                    vectorstore = ingestion.add_document(job.file_path, job.save_name, on_progress=job.update)
+                else:
+                    vectorstore = ingestion.ingest_document(job.file_path, job.save_name, on_progress=job.update)
+                if on_complete:
+                    on_complete(job, vectorstore)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.exception("ingest_failed", extra={"fields": {"job_id": job.id, "save_name": job.save_name}})
+        finally:
+            job.finished_at = time.time()
+            reset_request_id(token)
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j.status in ("done", "failed")]
+        excess = len(self.jobs) - self.max_retained
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(excess, 0)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in list(self.jobs.values())]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "active": self._active()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
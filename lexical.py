@@ -0,0 +1,311 @@
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from src.chunk_store import BATCH_SIZE, MMAP_SIZE, iter_documents
+
+BM25_FILE = "bm25.sqlite"
+LEGACY_BM25_FILE = "bm25.json"
+
+_TOKEN = re.compile(r"\d+(?:[.,:]\d+)*%?|[a-z]+(?:'[a-z]+)?")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "has", "how",
+    "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when",
+    "where", "which", "who", "will", "with", "shall", "there", "their", "do"
+}
+
+_LEXICAL_PATTERNS = [
+    re.compile(r"\b(section|clause|article|schedule|exhibit|appendix|annex)\s+[\dA-Z]", re.IGNORECASE),
+    re.compile(r"§\s*\d"),
+    re.compile(r"[$€£]\s?\d"),
+    re.compile(r"\b\d+(?:[.,]\d+)+\b"),
+    re.compile(r"\b\d{1,2}/\d{1,2}/\d{2,4}\b"),
+    re.compile(r"[\"'“][^\"'”]{2,}[\"'”]")
+]
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def is_lexical_query(query: str) -> bool:
+    if any(pattern.search(query) for pattern in _LEXICAL_PATTERNS):
+        return True
+
+    # Short queries made of capitalised names ("Acme Holdings Ltd") are lookups.
+    words = query.strip().rstrip("?.!").split()
+    return 0 < len(words) <= 4 and all(word[:1].isupper() or word[:1].isdigit() for word in words)
+
+
+class BM25Index:
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+        self.avg_length = 0.0
+
+    @classmethod
+    def from_documents(cls, items: Iterable[Tuple[str, str]], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        for doc_id, text in items:
+            index.add(doc_id, text)
+        index._finalize()
+        return index
+
+    def add(self, doc_id: str, text: str):
+        position = len(self.doc_ids)
+        counts = Counter(tokenize(text))
+        self.doc_ids.append(doc_id)
+        self.doc_lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            self.postings[term].append((position, tf))
+
+    def _finalize(self):
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def idf(self, term: str) -> float:
+        return self._idf(len(self.postings.get(term, ())))
+
+    def _idf(self, df: int) -> float:
+        n = len(self)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _postings(self, term: str) -> List[Tuple[int, int, int]]:
+        return [(position, tf, self.doc_lengths[position]) for position, tf in self.postings.get(term, ())]
+
+    def _doc_ids(self, positions: List[int]) -> Dict[int, str]:
+        return {position: self.doc_ids[position] for position in positions}
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if not postings:
+                continue
+            idf = self._idf(len(postings))
+            for position, tf, length in postings:
+                length_norm = 1 - self.b + self.b * length / (self.avg_length or 1)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        doc_ids = self._doc_ids([position for position, _ in ranked])
+        return [(doc_ids[position], score) for position, score in ranked]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def memory_bytes(self) -> int:
+        # Small ints are shared, so each posting costs its (position, tf) tuple
+        # plus a list slot; each term costs its key, list and dict slot.
+        num_postings = sum(len(postings) for postings in self.postings.values())
+        size = num_postings * (sys.getsizeof((0, 0)) + 8)
+        size += sum(sys.getsizeof(term) + sys.getsizeof([]) + 100 for term in self.postings)
+        size += sum(sys.getsizeof(doc_id) + 16 for doc_id in self.doc_ids)
+        return size
+
+    def save(self, folder: str):
+        # One row per posting, clustered by term so a search reads only its
+        # own terms, and indexed by document so edits can update it in place.
+        # Written beside the live file and swapped in, like chunks.sqlite.
+        path = os.path.join(folder, BM25_FILE)
+        temp_path = path + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        conn = sqlite3.connect(temp_path)
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        conn.execute(
+            "CREATE TABLE docs (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, length INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE postings (term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, doc)) WITHOUT ROWID"
+        )
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("k1", self.k1), ("b", self.b), ("num_docs", len(self.doc_ids)), ("total_length", sum(self.doc_lengths))
+        ])
+        conn.executemany("INSERT INTO docs VALUES (?, ?, ?)", (
+            (position, doc_id, length) for position, (doc_id, length) in enumerate(zip(self.doc_ids, self.doc_lengths))
+        ))
+        conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", (
+            (term, position, tf) for term, postings in self.postings.items() for position, tf in postings
+        ))
+        conn.execute("CREATE INDEX idx_postings_doc ON postings(doc)")
+        conn.commit()
+        conn.close()
+
+        os.replace(temp_path, path)
+        legacy_path = os.path.join(folder, LEGACY_BM25_FILE)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    @classmethod
+    def load(cls, folder: str) -> Optional["BM25Index"]:
+        if os.path.exists(os.path.join(folder, BM25_FILE)):
+            return BM25Store(folder)
+
+        # Indexes saved before bm25.sqlite are read whole; saving them again converts them.
+        path = os.path.join(folder, LEGACY_BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        index = cls(k1=data["k1"], b=data["b"])
+        index.doc_ids = data["doc_ids"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = defaultdict(list, {
+            term: [tuple(p) for p in postings] for term, postings in data["postings"].items()
+        })
+        index._finalize()
+        return index
+
+
+class BM25Store(BM25Index):
+    # View of a saved bm25.sqlite. Only the scoring constants are held in
+    # memory; postings are read per query term through the OS page cache, so
+    # workers share one copy. update() edits the file in place.
+
+    def __init__(self, folder: str):
+        self.path = os.path.join(folder, BM25_FILE)
+        self._local = threading.local()
+        meta = dict(self._conn().execute("SELECT key, value FROM meta"))
+        super().__init__(k1=meta["k1"], b=meta["b"])
+        self._set_totals(meta)
+
+    def _set_totals(self, meta: Dict[str, float]):
+        self.num_docs = int(meta["num_docs"])
+        self.avg_length = meta["total_length"] / self.num_docs if self.num_docs else 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def add(self, doc_id: str, text: str):
+        # Ids are unique in the file, so adding a saved id replaces it.
+        self.update([(doc_id, text)], [doc_id])
+
+    def update(self, added: Iterable[Tuple[str, str]], removed: Iterable[str] = ()):
+        # Removes, then appends, documents in one transaction. An id that is
+        # both removed and added is replaced.
+        removed = list(removed)
+        conn = sqlite3.connect(self.path)
+        with conn:
+            for start in range(0, len(removed), BATCH_SIZE):
+                batch = removed[start:start + BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                positions = [row[0] for row in conn.execute(
+                    f"SELECT position FROM docs WHERE id IN ({placeholders})", batch
+                )]
+                if positions:
+                    placeholders = ",".join("?" * len(positions))
+                    conn.execute(f"DELETE FROM postings WHERE doc IN ({placeholders})", positions)
+                    conn.execute(f"DELETE FROM docs WHERE position IN ({placeholders})", positions)
+
+            position = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM docs").fetchone()[0]
+            for doc_id, text in added:
+                counts = Counter(tokenize(text))
+                conn.execute("INSERT INTO docs VALUES (?, ?, ?)", (position, doc_id, sum(counts.values())))
+                conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                 ((term, position, tf) for term, tf in counts.items()))
+                position += 1
+
+            num_docs, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            conn.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                             [(num_docs, "num_docs"), (total_length, "total_length")])
+        conn.close()
+        self._set_totals({"num_docs": num_docs, "total_length": total_length})
+
+    def idf(self, term: str) -> float:
+        return self._idf(len(self._postings(term)))
+
+    def _postings(self, term: str) -> List[Tuple[int, int, int]]:
+        return self._conn().execute(
+            "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.position = p.doc WHERE p.term = ?", (term,)
+        ).fetchall()
+
+    def _doc_ids(self, positions: List[int]) -> Dict[int, str]:
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(positions), BATCH_SIZE):
+            batch = positions[start:start + BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(f"SELECT position, id FROM docs WHERE position IN ({placeholders})", batch))
+        return found
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def memory_bytes(self) -> int:
+        return 0
+
+
+def build_from_vectorstore(vectorstore) -> BM25Index:
+    return BM25Index.from_documents((doc_id, doc.page_content) for doc_id, doc in iter_documents(vectorstore))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def benchmark(retriever, cases: List[Dict[str, Any]], k: int = 4) -> Dict[str, Any]:
+    report = {}
+    for mode in ("vector", "hybrid"):
+        retriever.mode = mode
+        latencies, hits = [], 0
+        for case in cases:
+            start = time.perf_counter()
+            docs = retriever.search_with_scores(case["question"], k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            text = " ".join(doc.page_content.lower() for doc, _ in docs)
+            if any(keyword.lower() in text for keyword in case["expected_keywords"]):
+                hits += 1
+
+        latencies.sort()
+        report[mode] = {
+            "hit_rate": round(hits / len(cases), 3) if cases else 0.0,
+            "latency_ms_avg": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "latency_ms_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0
+        }
+    report["retriever_stats"] = retriever.stats()
+    return report
+
+
+def main():
+    from src.ingestion import DocumentIngestion
+    from src.retrieval import DocumentRetriever
+
+    parser = argparse.ArgumentParser(description="Vector vs hybrid BM25 retrieval benchmark")
+    parser.add_argument("--vectorstore", required=True, help="Name of a saved index under ./vectorstore")
+    parser.add_argument("--cases", required=True, help="JSONL file with question and expected_keywords")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.cases, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    vectorstore = DocumentIngestion().load_vectorstore(args.vectorstore)
+    report = benchmark(DocumentRetriever(vectorstore, k=args.k), cases, k=args.k)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
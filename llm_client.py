@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ChatMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", GROQ_BASE_URL)
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def message_role(message: BaseMessage) -> str:
+    if isinstance(message, SystemMessage):
+        return "system"
+    if isinstance(message, AIMessage):
+        return "assistant"
+    if isinstance(message, ChatMessage):
+        return message.role
+    return "user"
+
+
+class LLMClient:
+    # One pooled HTTP client per process for any OpenAI-compatible
+    # /chat/completions endpoint. Identical requests already in flight share
+    # a single upstream call.
+
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: Optional[str] = None,
+                 timeout: float = LLM_TIMEOUT, connect_timeout: float = LLM_CONNECT_TIMEOUT,
+                 max_connections: int = LLM_MAX_CONNECTIONS, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else os.getenv("LLM_API_KEY") or os.getenv("GROQ_API_KEY")
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._async_inflight = {}
+
+        self.requests = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.upstream_time_total = 0.0
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _sync_client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        base_url=self.base_url, headers=self._headers(), timeout=self.timeout, limits=self.limits
+                    )
+        return self._client
+
+    def _async_client_for_loop(self) -> httpx.AsyncClient:
+        # An AsyncClient is tied to the event loop it was first used on.
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self._headers(), timeout=self.timeout, limits=self.limits
+            )
+            self._async_loop = loop
+            self._async_inflight = {}
+        return self._async_client
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(delay, self.backoff_max)
+
+    def _should_retry(self, attempt: int, response: Optional[httpx.Response]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS
+
+    def _result(self, response: httpx.Response) -> Dict[str, Any]:
+        if response.status_code >= 400:
+            self.errors += 1
+            raise LLMError(f"LLM request failed ({response.status_code}): {response.text[:200]}",
+                           response.status_code)
+        return response.json()
+
+    def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        client = self._sync_client()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            start = time.perf_counter()
+            try:
+                response = client.post("/chat/completions", json=payload)
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, None):
+                    self.errors += 1
+                    raise LLMError(f"LLM request failed: {e}") from e
+            finally:
+                self.requests += 1
+                self.upstream_time_total += time.perf_counter() - start
+
+            if response is not None and not self._should_retry(attempt, response):
+                return self._result(response)
+            self.retries += 1
+            time.sleep(self._backoff(attempt, response))
+
+    async def _apost(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        client = self._async_client_for_loop()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat/completions", json=payload)
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, None):
+                    self.errors += 1
+                    raise LLMError(f"LLM request failed: {e}") from e
+            finally:
+                self.requests += 1
+                self.upstream_time_total += time.perf_counter() - start
+
+            if response is not None and not self._should_retry(attempt, response):
+                return self._result(response)
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+
+    def complete(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        key = request_key(payload)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._post(payload)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.set_exception(LLMError("Coalesced request was interrupted"))
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def acomplete(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self._async_client_for_loop()
+        key = request_key(payload)
+        future = self._async_inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._apost(payload)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no other caller was waiting.
+            future.exception()
+            raise
+        finally:
+            # A cancelled owner (e.g. the client disconnected) skips the handler
+            # above; fail the shared future so coalesced waiters do not hang.
+            if not future.done():
+                future.set_exception(LLMError("Coalesced request was cancelled"))
+                future.exception()
+            self._async_inflight.pop(key, None)
+
+    @staticmethod
+    def _iter_deltas(lines: Iterator[str]) -> Iterator[str]:
+        for line in lines:
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            choices = json.loads(data).get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
+
+    def stream(self, payload: Dict[str, Any]) -> Iterator[str]:
+        # Streams are not coalesced, and are only retried before the first token.
+        payload = dict(payload, stream=True)
+        client = self._sync_client()
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            with client.stream("POST", "/chat/completions", json=payload) as response:
+                if response.status_code >= 400 and self._should_retry(attempt, response):
+                    self.retries += 1
+                    time.sleep(self._backoff(attempt, response))
+                    continue
+                if response.status_code >= 400:
+                    response.read()
+                    self._result(response)
+                yield from self._iter_deltas(response.iter_lines())
+                return
+
+    async def astream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        payload = dict(payload, stream=True)
+        client = self._async_client_for_loop()
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            async with client.stream("POST", "/chat/completions", json=payload) as response:
+                if response.status_code >= 400 and self._should_retry(attempt, response):
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, response))
+                    continue
+                if response.status_code >= 400:
+                    await response.aread()
+                    self._result(response)
+                async for line in response.aiter_lines():
+                    for content in self._iter_deltas([line]):
+                        yield content
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "upstream_requests": self.requests,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._inflight) + len(self._async_inflight),
+            "avg_upstream_ms": round(self.upstream_time_total / self.requests * 1000, 2) if self.requests else 0.0
+        }
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class PooledChatModel(BaseChatModel):
+    client: Any
+    model_name: str = LLM_MODEL
+    temperature: float = 0.1
+    max_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "openai-compatible"
+
+    def _payload(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        payload = {
+            "model": self.model_name,
+            "messages": [{"role": message_role(m), "content": m.content} for m in messages],
+            "temperature": self.temperature
+        }
+        if self.max_tokens:
+            payload["max_tokens"] = self.max_tokens
+        if stop:
+            payload["stop"] = stop
+        payload.update(kwargs)
+        return payload
+
+    @staticmethod
+    def _chat_result(data: Dict[str, Any]) -> ChatResult:
+        content = data["choices"][0]["message"].get("content") or ""
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={"token_usage": data.get("usage", {}), "model_name": data.get("model")}
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        return self._chat_result(self.client.complete(self._payload(messages, stop, **kwargs)))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        return self._chat_result(await self.client.acomplete(self._payload(messages, stop, **kwargs)))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for content in self.client.stream(self._payload(messages, stop, **kwargs)):
+            if run_manager:
+                run_manager.on_llm_new_token(content)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        async for content in self.client.astream(self._payload(messages, stop, **kwargs)):
+            if run_manager:
+                await run_manager.on_llm_new_token(content)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = LLMClient()
+    return _shared_client
+
+
+def llm_stats() -> Optional[Dict[str, Any]]:
+    return _shared_client.stats() if _shared_client is not None else None
+
+
+async def close_llm_client():
+    if _shared_client is not None:
+        await _shared_client.aclose()
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_RESPONSE = os.getenv("STUB_RESPONSE", "This is a canned answer from the local stub LLM.")
+STUB_DELAY = float(os.getenv("STUB_DELAY", "0.2"))
+STUB_FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", "0"))
+
+app = FastAPI(title="OpenAI-compatible stub LLM")
+
+counters = {"requests": 0, "rate_limited": 0, "streams": 0}
+
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": 0}
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+
+    if STUB_FAIL_RATE and random.random() < STUB_FAIL_RATE:
+        counters["rate_limited"] += 1
+        return JSONResponse({"error": {"message": "Rate limit reached"}}, status_code=429,
+                            headers={"Retry-After": "0.1"})
+
+    await asyncio.sleep(STUB_DELAY)
+    model = body.get("model", "stub")
+
+    if not body.get("stream"):
+        return completion(model, STUB_RESPONSE)
+
+    counters["streams"] += 1
+
+    async def events():
+        for word in STUB_RESPONSE.split(" "):
+            chunk = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0.01)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    return counters
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible LLM stub for tests and benchmarks")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Any, Dict, Optional
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")
+LOG_MAX_MB = float(os.getenv("LOG_MAX_MB", "50"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+ROOT_LOGGER = "contract_assistant"
+
+_request_id = ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id: Optional[str]):
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class ContextFilter(logging.Filter):
+    # Runs on the caller's thread, before the record is queued, so the
+    # request id is read from the right context.
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = get_request_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # Warnings and errors are always kept. Other records are sampled per
+    # request id, so a sampled request keeps all of its lines.
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            keep = zlib.crc32(request_id.encode("utf-8")) / 0xFFFFFFFF < self.rate
+        else:
+            keep = random.random() < self.rate
+        if not keep:
+            self.sampled_out += 1
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            **getattr(record, "fields", {})
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BufferedQueueHandler(QueueHandler):
+    # Callers only pay for a queue put; a full queue drops the record instead
+    # of blocking the request.
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def file_handler(path: str, rotate: str = LOG_ROTATE) -> logging.Handler:
+    if rotate == "time":
+        handler = TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding="utf-8")
+    elif rotate == "size":
+        handler = RotatingFileHandler(path, maxBytes=int(LOG_MAX_MB * 1024 * 1024), backupCount=LOG_BACKUPS,
+                                      encoding="utf-8")
+    else:
+        raise ValueError(f"Unknown log rotation: {rotate}")
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+class LogWriter:
+    # One background thread per process owns the log file; every logger
+    # under ROOT_LOGGER hands records to it through a bounded queue.
+
+    def __init__(self, name: str, sample_rate: float = LOG_SAMPLE_RATE, rotate: str = LOG_ROTATE):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self.path = os.path.join(LOG_DIR, f"{name}.log")
+        self.handler = BufferedQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        self.handler.addFilter(ContextFilter())
+        self.sampler = SamplingFilter(sample_rate)
+        self.handler.addFilter(self.sampler)
+        self.listener = QueueListener(self.handler.queue, file_handler(self.path, rotate))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(self.handler)
+        root.propagate = False
+        self.stopped = False
+        self.listener.start()
+
+    def stop(self):
+        # Flushes whatever is still queued; safe to call more than once.
+        if self.stopped:
+            return
+        self.stopped = True
+        logging.getLogger(ROOT_LOGGER).removeHandler(self.handler)
+        self.listener.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+            "sample_rate": self.sampler.rate
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def configure(name: str = "app", **kwargs) -> LogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter(name, **kwargs)
+            atexit.register(_writer.stop)
+    return _writer
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def log_stats() -> Dict[str, Any]:
+    return _writer.stats() if _writer else {"configured": False}
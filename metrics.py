@@ -0,0 +1,121 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current = ContextVar("sca_timings", default=None)
+
+
+class Histogram:
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+
+    def __init__(self, name: str = "sca_stage_duration_seconds"):
+        self.name = name
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation: str, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get((operation, stage))
+            if histogram is None:
+                histogram = self.histograms[(operation, stage)] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} Time spent in each stage of an operation.",
+            f"# TYPE {self.name} histogram"
+        ]
+        with self._lock:
+            for (operation, stage), histogram in sorted(self.histograms.items()):
+                labels = f'operation="{operation}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"{self.name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                f"{operation}.{stage}": {
+                    "count": h.count,
+                    "avg_ms": round(h.total / h.count * 1000, 3) if h.count else 0.0
+                }
+                for (operation, stage), h in sorted(self.histograms.items())
+            }
+
+
+REGISTRY = MetricsRegistry()
+
+
+def add_time(stage: str, seconds: float):
+    current = _current.get()
+    if current is None:
+        REGISTRY.observe("other", stage, seconds)
+        return
+    _, timings = current
+    timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def track(operation: str) -> Iterator[Dict[str, float]]:
+    # Stage times accumulate per operation and are published once it ends,
+    # so a stage hit once per batch still lands as a single observation.
+    timings = {}
+    report = {}
+    token = _current.set((operation, timings))
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        timings["total"] = time.perf_counter() - start
+        _current.reset(token)
+        for stage, seconds in timings.items():
+            REGISTRY.observe(operation, stage, seconds)
+            report[stage] = round(seconds * 1000, 3)
+
+
+def timed(iterable: Iterable, stage: str) -> Iterator:
+    # Charges only the time spent producing items, not the consumer's work.
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            add_time(stage, time.perf_counter() - start)
+        yield item
@@ -0,0 +1,150 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+ONNX_DIR = os.getenv("ONNX_DIR", "cache/onnx")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+
+
+def sentence_transformer_config(model_name: str) -> Dict[str, Any]:
+    # Pooling, normalisation and max length must match the sentence-transformers
+    # pipeline, or the vectors would not be comparable with the torch index.
+    config = {"max_seq_length": 256, "normalize": True}
+    try:
+        from huggingface_hub import hf_hub_download
+
+        with open(hf_hub_download(model_name, "modules.json"), encoding="utf-8") as f:
+            modules = json.load(f)
+        config["normalize"] = any(m.get("type", "").endswith("Normalize") for m in modules)
+        with open(hf_hub_download(model_name, "sentence_bert_config.json"), encoding="utf-8") as f:
+            config["max_seq_length"] = json.load(f).get("max_seq_length", config["max_seq_length"])
+    except Exception:
+        pass
+    return config
+
+
+def export_model(model_name: str, quantize: bool = False) -> str:
+    # One-off export; torch is only needed here, never at inference time.
+    folder = _model_dir(model_name)
+    fp32_path = os.path.join(folder, "model.onnx")
+    int8_path = os.path.join(folder, "model.int8.onnx")
+    target = int8_path if quantize else fp32_path
+    if os.path.exists(target):
+        return target
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(folder, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        tokenizer.save_pretrained(folder)
+
+        inputs = tokenizer(["export"], return_tensors="pt")
+        names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+        dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+        dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(inputs[name] for name in names), fp32_path,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic, opset_version=14
+            )
+        with open(os.path.join(folder, "st_config.json"), "w", encoding="utf-8") as f:
+            json.dump(sentence_transformer_config(model_name), f)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxEmbeddings(Embeddings):
+
+    def __init__(self, model_name: str, quantize: bool = False, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 num_threads: int = EMBEDDING_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.base_model = model_name
+        self.quantize = quantize
+        self.model_name = f"{model_name}@onnx{'-int8' if quantize else ''}"
+        self.batch_size = batch_size
+
+        path = export_model(model_name, quantize)
+        folder = _model_dir(model_name)
+        with open(os.path.join(folder, "st_config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.normalize = config["normalize"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(folder, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        weights = mask[..., None].astype(np.float32)
+        vectors = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batching texts of similar length keeps padding (and wasted compute) low.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embedded = self._embed_batch([texts[i] for i in batch])
+            if vectors.shape[1] == 0:
+                vectors = np.zeros((len(texts), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def create_embeddings(model_name: str, backend: str, batch_size: Optional[int] = None,
+                      num_threads: Optional[int] = None) -> Embeddings:
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    num_threads = EMBEDDING_THREADS if num_threads is None else num_threads
+
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddings(model_name, quantize=backend == "onnx-int8",
+                              batch_size=batch_size, num_threads=num_threads)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
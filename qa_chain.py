@@ -1,29 +1,99 @@
+import asyncio
 import os
-from typing import Dict, Any, List
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+from langchain_community.chat_models.fake import FakeListChatModel
 from langchain.prompts import PromptTemplate
+from src.logger import get_logger, log_event
+from src.metrics import REGISTRY, span, track
 from src.retrieval import DocumentRetriever
+from src.summarizer import Summarizer
 
 load_dotenv()
 
+logger = get_logger("qa")
+
 FORBIDDEN_TOPICS = [
     "password", "hack", "weapon", "illegal",
     "drug", "violence", "exploit"
 ]
 
 
+FAKE_LLM_RESPONSE = "This is a canned answer from the local fake LLM."
+
+CANNED_QUERIES = [
+    "Summarize this document in clear points",
+    "Who are the parties in this contract?",
+    "What is the contract duration?",
+    "What is the total value?",
+    "What are the termination conditions?"
+]
+
+
+class DelayedFakeChatModel(FakeListChatModel):
+    # The delay stands in for the model's time to first token, on the
+    # blocking and the streaming paths alike.
+    delay: float = 0.0
+
+    def _call(self, *args, **kwargs) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        return super()._call(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        yield from super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+def create_llm():
+    if os.getenv("LLM_BACKEND", "groq") == "fake":
+        return DelayedFakeChatModel(
+            responses=[os.getenv("FAKE_LLM_RESPONSE", FAKE_LLM_RESPONSE)],
+            delay=float(os.getenv("FAKE_LLM_DELAY", "0"))
+        )
+
+    # Any OpenAI-compatible endpoint: Groq by default, or a local stub via LLM_BASE_URL.
+    from src.llm_client import PooledChatModel, get_llm_client
+
+    return PooledChatModel(
+        client=get_llm_client(),
+        model_name=os.getenv("LLM_MODEL", "llama-3.3-70b-versatile"),
+        temperature=0.1
+    )
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_llm()
+    return _llm
+
+
 class QASystem:
 
-    def __init__(self, vectorstore):
+    def __init__(self, vectorstore, llm=None, document_id: str = "default", answer_cache=None):
         self.retriever = DocumentRetriever(vectorstore, k=4)
-        self.chat_history = []
+        self.document_id = document_id
+        self.answer_cache = answer_cache
+        self.cache_generation = answer_cache.generation(document_id) if answer_cache is not None else 0
 
-        self.llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            model_name="llama-3.3-70b-versatile",
-            temperature=0.1
-        )
+        self.llm = llm or get_llm()
+        self.summarizer = Summarizer(self.llm)
 
         self.prompt_template = PromptTemplate(
             template="""You are a helpful assistant analyzing documents.
@@ -58,8 +128,9 @@ Answer:""",
 
         return {"passed": True, "reason": ""}
 
-    def ask(self, question: str, k: int = 4) -> Dict[str, Any]:
-        guard_result = self.check_guardrails(question)
+    def _precheck(self, question: str, k: int) -> Optional[Dict[str, Any]]:
+        with span("guardrails"):
+            guard_result = self.check_guardrails(question)
         if not guard_result["passed"]:
             return {
                 "question": question,
@@ -68,7 +139,15 @@ Answer:""",
                 "guardrail_triggered": True
             }
 
-        result = self.retriever.get_context(question, k=k)
+        if self.answer_cache is not None:
+            with span("answer_cache"):
+                cached = self.answer_cache.get(self.document_id, question, k)
+            if cached is not None:
+                return cached
+
+        return None
+
+    def _build_prompt(self, question: str, result: Dict[str, Any]) -> Dict[str, Any]:
         context = result["context"]
         sources = result["sources"]
 
@@ -80,42 +159,145 @@ Answer:""",
                 "guardrail_triggered": False
             }
 
-        prompt = self.prompt_template.format(
-            context=context[:3000],
-            question=question
-        )
+        with span("prompt_format"):
+            prompt = self.prompt_template.format(
+                context=context,
+                question=question
+            )
+        return {
+            "prompt": prompt,
+            "sources": sources,
+            "context_tokens": result["context_tokens"],
+            "tokens_saved": result["tokens_saved"]
+        }
 
-        response = self.llm.invoke(prompt)
-        answer = response.content.strip()
+    def _prepare(self, question: str, k: int) -> Dict[str, Any]:
+        early = self._precheck(question, k)
+        if early is not None:
+            return early
+        return self._build_prompt(question, self.retriever.get_context(question, k=k))
 
-        self.chat_history.append({
-            "question": question,
-            "answer": answer
-        })
-
-        return {
+    def _finish(self, question: str, answer: str, prepared: Dict[str, Any], k: int) -> Dict[str, Any]:
+        sources = prepared["sources"]
+        result = {
             "question": question,
             "answer": answer,
             "sources": sources,
             "num_sources": len(sources),
+            "context_tokens": prepared["context_tokens"],
+            "tokens_saved": prepared["tokens_saved"],
             "guardrail_triggered": False
         }
+        if self.answer_cache is not None:
+            self.answer_cache.put(self.document_id, question, k, result, self.cache_generation)
+        return result
+
+    def ask(self, question: str, k: int = 4) -> Dict[str, Any]:
+        with track("ask") as timings:
+            result = self._ask(question, k)
+        return self._logged(dict(result, timings=timings))
+
+    async def aask(self, question: str, k: int = 4) -> Dict[str, Any]:
+        with track("ask") as timings:
+            # Retrieval is CPU-bound, so it runs off the event loop; the LLM
+            # call is awaited on the shared async client.
+            prepared = await asyncio.to_thread(self._prepare, question, k)
+            if "prompt" in prepared:
+                with span("llm"):
+                    response = await self.llm.ainvoke(prepared["prompt"])
+                prepared = self._finish(question, response.content.strip(), prepared, k)
+        return self._logged(dict(prepared, timings=timings))
+
+    def _logged(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        log_event(logger, "ask", document_id=self.document_id, question_chars=len(result["question"]),
+                  num_sources=len(result["sources"]), context_tokens=result.get("context_tokens"),
+                  guardrail_triggered=result["guardrail_triggered"], cached=result.get("cached", False),
+                  timings=result["timings"])
+        return result
+
+    def _ask(self, question: str, k: int) -> Dict[str, Any]:
+        prepared = self._prepare(question, k)
+        if "prompt" not in prepared:
+            return prepared
+
+        with span("llm"):
+            response = self.llm.invoke(prepared["prompt"])
+        answer = response.content.strip()
+
+        return self._finish(question, answer, prepared, k)
+
+    def ask_many(self, questions: List[str], k: int = 4, max_concurrency: int = 4) -> List[Dict[str, Any]]:
+        with track("ask_batch"):
+            return self._ask_many(questions, k, max_concurrency)
+
+    def _ask_many(self, questions: List[str], k: int, max_concurrency: int) -> List[Dict[str, Any]]:
+        results = [self._precheck(question, k) for question in questions]
+        pending = [i for i, result in enumerate(results) if result is None]
+
+        contexts = self.retriever.get_contexts([questions[i] for i in pending], k=k)
+        to_generate = []
+        for i, context in zip(pending, contexts):
+            prepared = self._build_prompt(questions[i], context)
+            if "prompt" in prepared:
+                to_generate.append((i, prepared))
+            else:
+                results[i] = prepared
+
+        with span("llm"):
+            responses = self.llm.batch(
+                [prepared["prompt"] for _, prepared in to_generate],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            ) if to_generate else []
+
+        for (i, prepared), response in zip(to_generate, responses):
+            if isinstance(response, Exception):
+                results[i] = {
+                    "question": questions[i],
+                    "answer": "",
+                    "sources": prepared["sources"],
+                    "guardrail_triggered": False,
+                    "error": str(response)
+                }
+            else:
+                results[i] = self._finish(questions[i], response.content.strip(), prepared, k)
 
-    def summarize(self) -> str:
-        docs = self.retriever.search("main topics summary overview", k=5)
-        combined = "\n".join([doc.page_content for doc in docs])
+        return results
 
-        prompt = f"""Summarize the following document in simple clear points:
+    def ask_stream(self, question: str, k: int = 4) -> Iterator[Dict[str, Any]]:
+        # Each step of a streamed response may run on a different worker
+        # thread, so only the synchronous prepare step is tracked; the LLM
+        # stages are observed directly.
+        with track("ask_stream") as timings:
+            prepared = self._prepare(question, k)
+        if "prompt" not in prepared:
+            yield {"type": "sources", "sources": prepared["sources"]}
+            yield {"type": "token", "content": prepared["answer"]}
+            yield {"type": "done", **prepared}
+            return
 
-{combined[:3000]}
+        yield {"type": "sources", "sources": prepared["sources"]}
 
-Summary:"""
+        parts = []
+        start = time.perf_counter()
+        for chunk in self.llm.stream(prepared["prompt"]):
+            if chunk.content:
+                if not parts:
+                    first_token = time.perf_counter() - start
+                    REGISTRY.observe("ask_stream", "llm_first_token", first_token)
+                    timings["llm_first_token"] = round(first_token * 1000, 3)
+                parts.append(chunk.content)
+                yield {"type": "token", "content": chunk.content}
+        llm_seconds = time.perf_counter() - start
+        REGISTRY.observe("ask_stream", "llm", llm_seconds)
+        timings["llm"] = round(llm_seconds * 1000, 3)
 
-        response = self.llm.invoke(prompt)
-        return response.content.strip()
+        answer = "".join(parts).strip()
+        yield {"type": "done", **self._finish(question, answer, prepared, k), "timings": timings}
 
-    def get_history(self) -> List[Dict]:
-        return self.chat_history
+    def summarize(self) -> Dict[str, Any]:
+        with track("summarize"):
+            return self.summarizer.summarize(self.retriever.vectorstore)
 
-    def clear_history(self):
-        self.chat_history = []
\ No newline at end of file
+    def summarize_stream(self) -> Iterator[Dict[str, Any]]:
+        return self.summarizer.stream(self.retriever.vectorstore)
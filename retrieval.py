@@ -1,44 +1,154 @@
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Optional
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
+from src.context import ContextBuilder
+from src.embeddings import get_query_embeddings
+from src.indexing import RESCORE_FACTOR, rescore
+from src.metrics import span
+from src.lexical import build_from_vectorstore, is_lexical_query, reciprocal_rank_fusion, tokenize
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "1.0"))
+
+
+def doc_key(doc: Document) -> tuple:
+    return doc.metadata.get("source"), doc.metadata.get("chunk_id")
 
 
 class DocumentRetriever:
 
-    def __init__(self, vectorstore: FAISS, k: int = 4):
+    def __init__(self, vectorstore: FAISS, k: int = 4, embeddings=None, mode: str = RETRIEVAL_MODE,
+                 lexical_index=None, context_builder: Optional[ContextBuilder] = None):
         self.vectorstore = vectorstore
         self.k = k
+        self.context_builder = context_builder or ContextBuilder()
+        self.embeddings = embeddings or get_query_embeddings()
+        self.mode = mode
+        self.lexical_index = lexical_index or getattr(vectorstore, "lexical_index", None)
+        self.counts = {"vector": 0, "hybrid": 0, "lexical_fast_path": 0}
 
-    def search(self, query: str, k: int = None) -> List[Document]:
-        search_k = k if k else self.k
-        docs = self.vectorstore.similarity_search(query, k=search_k)
+    def _lexical(self):
+        if self.lexical_index is None:
+            self.lexical_index = build_from_vectorstore(self.vectorstore)
+            self.vectorstore.lexical_index = self.lexical_index
+        return self.lexical_index
+
+    def _lexical_fast_path(self, query: str, k: int) -> Optional[List[tuple]]:
+        if self.mode == "vector" or not is_lexical_query(query):
+            return None
+
+        with span("lexical_search"):
+            hits = self._lexical().search(query, k)
+        docs = [(self.vectorstore.docstore.search(doc_id), score) for doc_id, score in hits]
+        docs = [(doc, score) for doc, score in docs if isinstance(doc, Document)]
+        if not docs:
+            return None
+
+        # Only skip the embedding when the best lexical hit contains the query terms.
+        terms = set(tokenize(query))
+        covered = terms & set(tokenize(docs[0][0].page_content))
+        if not terms or len(covered) / len(terms) < LEXICAL_MIN_COVERAGE:
+            return None
+
+        self.counts["lexical_fast_path"] += 1
         return docs
 
+    def _fetch_k(self, k: int) -> int:
+        return k if self.mode == "vector" else k * 2
+
+    def _vector_search(self, vectors: np.ndarray, k: int) -> List[List[tuple]]:
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            faiss.normalize_L2(vectors)
+
+        # Compressed indexes over-fetch and rescore against the exact vectors.
+        exact = getattr(self.vectorstore, "exact_vectors", None)
+        index = self.vectorstore.index
+        distances, indices = index.search(vectors, k * RESCORE_FACTOR if exact is not None else k)
+        if exact is not None:
+            distances, indices = rescore(exact, vectors, indices, k, index.metric_type)
+
+        results = []
+        for row_scores, row_indices in zip(distances, indices):
+            docs_with_scores = []
+            for score, position in zip(row_scores, row_indices):
+                if position == -1:
+                    continue
+                doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+                if isinstance(doc, Document):
+                    docs_with_scores.append((doc, float(score)))
+            results.append(docs_with_scores)
+        return results
+
+    def _combine(self, query: str, vector_results: List[tuple], k: int) -> List[tuple]:
+        if self.mode == "vector":
+            self.counts["vector"] += 1
+            return vector_results[:k]
+
+        self.counts["hybrid"] += 1
+        docs = {doc_key(doc): doc for doc, _ in vector_results}
+        lexical_ranking = []
+        with span("lexical_search"):
+            lexical_hits = self._lexical().search(query, k * 2)
+        for doc_id, _ in lexical_hits:
+            doc = self.vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs.setdefault(doc_key(doc), doc)
+                lexical_ranking.append(doc_key(doc))
+
+        with span("fusion"):
+            fused = reciprocal_rank_fusion([[doc_key(doc) for doc, _ in vector_results], lexical_ranking])
+        return [(docs[key], score) for key, score in fused[:k]]
+
+    def search(self, query: str, k: int = None) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query, k)]
+
     def search_with_scores(self, query: str, k: int = None) -> List[tuple]:
         search_k = k if k else self.k
-        docs_with_scores = self.vectorstore.similarity_search_with_score(query, k=search_k)
-        return docs_with_scores
+        fast = self._lexical_fast_path(query, search_k)
+        if fast:
+            return fast
 
-    def get_context(self, query: str, k: int = None) -> Dict[str, Any]:
-        docs_with_scores = self.search_with_scores(query, k)
+        with span("query_embedding"):
+            embedding = self.embeddings.embed_query(query)
+        with span("vector_search"):
+            docs_with_scores = self._vector_search(np.asarray([embedding], dtype=np.float32), self._fetch_k(search_k))
+        return self._combine(query, docs_with_scores[0], search_k)
 
-        if not docs_with_scores:
-            return {"context": "", "sources": [], "num_results": 0}
+    def search_many_with_scores(self, queries: List[str], k: int = None) -> List[List[tuple]]:
+        search_k = k if k else self.k
+        results = [self._lexical_fast_path(query, search_k) for query in queries]
+        pending = [i for i, result in enumerate(results) if not result]
+        if not pending:
+            return results
+
+        texts = [queries[i] for i in pending]
+        embed = getattr(self.embeddings, "embed_queries", self.embeddings.embed_documents)
+        with span("query_embedding"):
+            vectors = np.asarray(embed(texts), dtype=np.float32)
 
-        contexts = [doc.page_content for doc, _ in docs_with_scores]
-        combined_context = "\n\n---\n\n".join(contexts)
+        with span("vector_search"):
+            matches = self._vector_search(vectors, self._fetch_k(search_k))
 
-        sources = [
-            {
-                "source": doc.metadata.get("source", "Unknown"),
-                "chunk_id": doc.metadata.get("chunk_id", -1),
-                "score": float(score)
-            }
-            for doc, score in docs_with_scores
-        ]
+        for i, docs_with_scores in zip(pending, matches):
+            results[i] = self._combine(queries[i], docs_with_scores, search_k)
+        return results
 
+    def stats(self) -> Dict[str, Any]:
         return {
-            "context": combined_context,
-            "sources": sources,
-            "num_results": len(docs_with_scores)
-        }
\ No newline at end of file
+            "mode": self.mode,
+            "lexical_docs": len(self.lexical_index) if self.lexical_index is not None else 0,
+            **self.counts
+        }
+
+    def get_context(self, query: str, k: int = None) -> Dict[str, Any]:
+        return self.build_context(self.search_with_scores(query, k))
+
+    def get_contexts(self, queries: List[str], k: int = None) -> List[Dict[str, Any]]:
+        return [self.build_context(docs) for docs in self.search_many_with_scores(queries, k)]
+
+    def build_context(self, docs_with_scores: List[tuple]) -> Dict[str, Any]:
+        with span("context_build"):
+            return self.context_builder.build(docs_with_scores)
@@ -1,19 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langserve import add_routes
+import json
+import logging
 import os
 import shutil
-
-from src.ingestion import DocumentIngestion
-from src.qa_chain import QASystem
+import time
+import uuid
+
+from src.answer_cache import AnswerCache
+from src.corpus import IndexRegistry
+from src.embedding_cache import cache_stats as embedding_cache_stats
+from src.embeddings import get_query_embeddings, registry as embedding_registry
+from src.history import DEFAULT_SESSION, HistoryStore
+from src.ingestion import DocumentIngestion, index_lock
+from src.jobs import IngestionJobQueue, JobQueueFull
+from src.metrics import REGISTRY as metrics
+from src.llm_client import close_llm_client, llm_stats
+from src.logger import (
+    configure as configure_logging, get_logger, log_event, log_stats, new_request_id, reset_request_id,
+    set_request_id
+)
+from src.qa_chain import CANNED_QUERIES, QASystem, get_llm
+from src.warmup import Warmup
 
 load_dotenv()
+configure_logging("server")
+logger = get_logger("server")
 
 app = FastAPI(
     title="Smart Contract Assistant API",
@@ -28,34 +45,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ingestion = None
-qa_system = None
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    # Every log line written while serving the request carries its id; a
+    # client-supplied X-Request-ID is kept so logs can be joined across hops.
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = set_request_id(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.observe("http", f"{request.method} {path}", elapsed)
+        log_event(logger, "http_request", method=request.method, path=path, status=response.status_code,
+                  duration_ms=round(elapsed * 1000, 3))
+        response.headers["X-Request-ID"] = request_id
+        return response
+    except Exception:
+        logger.exception("http_error")
+        raise
+    finally:
+        reset_request_id(token)
+
+default_document = None
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")) or None
+)
+
+corpus = IndexRegistry(
+    memory_budget_mb=float(os.getenv("INDEX_MEMORY_BUDGET_MB", "512")),
+    build=lambda document_id, vectorstore: QASystem(
+        vectorstore, document_id=document_id, answer_cache=answer_cache
+    ),
+    on_update=answer_cache.invalidate
+)
+
+history_store = HistoryStore()
+
+job_queue = IngestionJobQueue(
+    max_workers=int(os.getenv("INGEST_WORKERS", "2")),
+    max_pending=int(os.getenv("INGEST_MAX_PENDING", "8"))
+)
 
 
 class QuestionRequest(BaseModel):
     question: str
     k: int = 4
+    document_id: Optional[str] = None
+    session_id: Optional[str] = None
+    include_timings: bool = False
 
 
 class QuestionResponse(BaseModel):
+    document_id: str
+    session_id: str
     question: str
     answer: str
     sources: List[Dict]
     guardrail_triggered: bool = False
+    cached: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
 
 
-llm = ChatGroq(
-    groq_api_key=os.getenv("GROQ_API_KEY"),
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1
-)
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    k: int = 4
+    document_id: Optional[str] = None
+    session_id: Optional[str] = None
+    max_concurrency: Optional[int] = None
+
+
+MAX_HISTORY_PAGE = 500
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "100"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LANGSERVE_ENABLED = os.getenv("LANGSERVE_ENABLED", "1") == "1"
+PRELOAD_DEFAULT_INDEX = os.getenv("PRELOAD_DEFAULT_INDEX", "1") == "1"
+
+warmup = Warmup()
+
+
+def mount_langserve():
+    # langserve is slow to import, so it is mounted by the background
+    # warm-up; the route shares the same pooled LLM as /ask.
+    from langchain.prompts import PromptTemplate
+    from langserve import add_routes
+
+    prompt = PromptTemplate(
+        template="Answer this question clearly: {question}",
+        input_variables=["question"]
+    )
+    add_routes(app, prompt | get_llm(), path="/langserve")
+    app.openapi_schema = None
+
+
+def preload_default_document():
+    if default_document is not None:
+        corpus.get(default_document)
 
-prompt = PromptTemplate(
-    template="Answer this question clearly: {question}",
-    input_variables=["question"]
-)
 
-add_routes(app, prompt | llm, path="/langserve")
+@app.on_event("startup")
+async def startup():
+    global default_document
+    # The default is the index written last (see persisted_documents), the
+    # same one the previous run was serving after its latest upload.
+    persisted = corpus.persisted_documents()
+    if default_document is None and persisted:
+        default_document = persisted[0]
+
+    warmup.add("embeddings", embedding_registry.warm_up)
+    warmup.add("canned_queries", lambda: get_query_embeddings().precompute(CANNED_QUERIES))
+    if LANGSERVE_ENABLED:
+        warmup.add("langserve", mount_langserve, required=False)
+    if PRELOAD_DEFAULT_INDEX:
+        warmup.add("default_index", preload_default_document, required=False)
+    warmup.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    job_queue.shutdown()
+    await close_llm_client()
 
 
 @app.get("/")
@@ -66,74 +180,268 @@ async def root():
 @app.get("/health")
 async def health():
     return {
-        "status": "healthy",
-        "document_loaded": qa_system is not None,
-        "langserve": "http://127.0.0.1:8000/langserve"
+        "status": "healthy" if warmup.is_ready() else warmup.status,
+        "ready": warmup.is_ready(),
+        "warmup": warmup.stats(),
+        "document_loaded": default_document is not None,
+        "default_document": default_document,
+        "corpus": corpus.stats(),
+        "answer_cache": answer_cache.stats(),
+        "embeddings": embedding_registry.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "ingestion": job_queue.stats(),
+        "history": history_store.stats(),
+        "logging": log_stats(),
+        "llm": llm_stats(),
+        "stage_latency": metrics.summary(),
+        "langserve": "http://127.0.0.1:8000/langserve" if "langserve" in warmup.completed else None
     }
 
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    global ingestion, qa_system
+@app.get("/ready")
+async def ready():
+    if not warmup.is_ready():
+        raise HTTPException(status_code=503, detail=f"Warming up: {warmup.status}",
+                            headers={"Retry-After": "2"})
+    return {"ready": True, "warmup": warmup.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
+@app.post("/upload", status_code=202)
+async def upload(file: UploadFile = File(...), document_id: Optional[str] = Form(None)):
     if not (file.filename.endswith('.pdf') or file.filename.endswith('.docx')):
         raise HTTPException(status_code=400, detail="Only PDF and DOCX supported")
 
+    if document_id is not None and not corpus.is_valid_id(document_id):
+        raise HTTPException(status_code=400, detail=f"Invalid document id: {document_id}")
+    # Checked before anything is written: the job creates ./vectorstore/<name>.
+    save_name = document_id or os.path.splitext(file.filename)[0]
+    if not corpus.is_valid_id(save_name):
+        raise HTTPException(status_code=400, detail=f"Invalid document name: {file.filename}; pass a document_id")
+
+    if job_queue.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later",
+                            headers={"Retry-After": "5"})
+
     try:
-        os.makedirs("data", exist_ok=True)
-        temp_path = f"data/{file.filename}"
+        # Each upload gets its own folder: the file name is the chunk source,
+        # and a second upload of the same name must not overwrite one in use.
+        upload_dir = os.path.join("data", uuid.uuid4().hex)
+        os.makedirs(upload_dir, exist_ok=True)
+        temp_path = os.path.join(upload_dir, os.path.basename(file.filename))
 
         with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
 
-        ingestion = DocumentIngestion()
-        save_name = os.path.splitext(file.filename)[0]
-        vectorstore = ingestion.ingest_document(temp_path, save_name)
-        qa_system = QASystem(vectorstore)
+        if document_id:
+            job = job_queue.submit(temp_path, save_name, on_complete=_on_ingested, mode="add")
+        else:
+            job = job_queue.submit(temp_path, save_name, on_complete=_on_ingested)
 
         return {
-            "message": "Document processed successfully",
+            "message": "Document queued for processing",
             "filename": file.filename,
-            "status": "ready"
+            "document_id": save_name,
+            "job_id": job.id,
+            "status": job.status
         }
 
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
+        logger.exception("request_failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/ask", response_model=QuestionResponse)
-async def ask(request: QuestionRequest):
-    global qa_system
+def _on_ingested(job, vectorstore):
+    global default_document
+    corpus.put(job.save_name, vectorstore)
+    default_document = job.save_name
 
-    if qa_system is None:
+
+async def get_qa_system(document_id: Optional[str]) -> QASystem:
+    document_id = document_id or default_document
+    if document_id is None:
         raise HTTPException(status_code=400, detail="Please upload a document first")
 
+    qa_system = await run_in_threadpool(corpus.get, document_id)
+    if qa_system is None:
+        raise HTTPException(status_code=404, detail=f"Document not found: {document_id}")
+    return qa_system
+
+
+@app.get("/documents")
+async def documents():
+    docs = corpus.list_documents()
+    return {"documents": docs, "total": len(docs), "stats": corpus.stats()}
+
+
+@app.get("/documents/{document_id}/sources")
+async def document_sources(document_id: str):
+    if not corpus.is_valid_id(document_id):
+        raise HTTPException(status_code=400, detail=f"Invalid document id: {document_id}")
+    sources = await run_in_threadpool(DocumentIngestion().list_sources, document_id)
+    return {"document_id": document_id, "sources": sources, "total": len(sources)}
+
+
+def _remove_source(document_id: str, source: str):
+    # Same per-index lock as ingestion jobs, held until the registry is updated.
+    with index_lock(document_id):
+        vectorstore = DocumentIngestion().remove_document(source, document_id)
+        if vectorstore is not None:
+            corpus.put(document_id, vectorstore)
+        return vectorstore
+
+
+@app.delete("/documents/{document_id}/sources/{source}")
+async def remove_source(document_id: str, source: str):
+    if not corpus.is_valid_id(document_id):
+        raise HTTPException(status_code=400, detail=f"Invalid document id: {document_id}")
+
     try:
-        result = qa_system.ask(request.question)
+        vectorstore = await run_in_threadpool(_remove_source, document_id, source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if vectorstore is None:
+        raise HTTPException(status_code=404, detail=f"Document not found: {document_id}")
+
+    return {"message": "Source removed", "document_id": document_id, "source": source}
+
+
+@app.get("/jobs")
+async def list_jobs():
+    jobs = job_queue.list()
+    return {"jobs": jobs, "total": len(jobs)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+def record_turn(session_id: str, document_id: str, result: Dict):
+    if result.get("error") or result.get("guardrail_triggered"):
+        return
+    history_store.append(session_id, result["question"], result["answer"], document_id)
+
+
+@app.post("/ask", response_model=QuestionResponse)
+async def ask(request: QuestionRequest):
+    qa_system = await get_qa_system(request.document_id)
+    session_id = request.session_id or DEFAULT_SESSION
+
+    try:
+        result = await qa_system.aask(request.question, k=request.k)
+        record_turn(session_id, qa_system.document_id, result)
         return QuestionResponse(
+            document_id=qa_system.document_id,
+            session_id=session_id,
             question=request.question,
             answer=result['answer'],
             sources=result['sources'],
-            guardrail_triggered=result.get('guardrail_triggered', False)
+            guardrail_triggered=result.get('guardrail_triggered', False),
+            cached=result.get('cached'),
+            timings=result.get('timings') if request.include_timings else None
+        )
+
+    except Exception as e:
+        logger.exception("request_failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchQuestionRequest):
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+
+    qa_system = await get_qa_system(request.document_id)
+    concurrency = min(request.max_concurrency or LLM_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY)
+
+    try:
+        results = await run_in_threadpool(
+            qa_system.ask_many, request.questions, request.k, max(concurrency, 1)
         )
+    except Exception as e:
+        logger.exception("request_failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    session_id = request.session_id or DEFAULT_SESSION
+    for result in results:
+        record_turn(session_id, qa_system.document_id, result)
+
+    return {
+        "document_id": qa_system.document_id,
+        "session_id": session_id,
+        "results": results,
+        "total": len(results),
+        "failed": sum(1 for r in results if r.get("error"))
+    }
+
+
+def sse_response(events) -> StreamingResponse:
+    def body():
+        try:
+            for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            log_event(logger, "stream_failed", logging.ERROR, error=str(e))
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
 
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: QuestionRequest):
+    qa_system = await get_qa_system(request.document_id)
+    session_id = request.session_id or DEFAULT_SESSION
+
+    def events():
+        for event in qa_system.ask_stream(request.question, k=request.k):
+            if event["type"] == "done":
+                record_turn(session_id, qa_system.document_id, event)
+            yield event
+
+    return sse_response(events())
+
+
+@app.get("/summary")
+async def summary(document_id: Optional[str] = None):
+    qa_system = await get_qa_system(document_id)
+    try:
+        result = await run_in_threadpool(qa_system.summarize)
     except Exception as e:
+        logger.exception("request_failed")
         raise HTTPException(status_code=500, detail=str(e))
+    return {"document_id": qa_system.document_id, **result}
+
+
+@app.get("/summary/stream")
+async def summary_stream(document_id: Optional[str] = None):
+    qa_system = await get_qa_system(document_id)
+    return sse_response(qa_system.summarize_stream())
 
 
 @app.get("/history")
-async def history():
-    if qa_system is None:
-        return {"history": [], "total": 0}
-    h = qa_system.get_history()
-    return {"history": h, "total": len(h)}
+async def history(session_id: str = DEFAULT_SESSION, offset: int = Query(0, ge=0),
+                  limit: int = Query(50, ge=1, le=MAX_HISTORY_PAGE)):
+    return await run_in_threadpool(history_store.page, session_id, offset, limit)
 
 
 @app.delete("/history")
-async def clear():
-    if qa_system:
-        qa_system.clear_history()
-    return {"message": "History cleared"}
+async def clear(session_id: str = DEFAULT_SESSION):
+    await run_in_threadpool(history_store.clear, session_id)
+    return {"message": "History cleared", "session_id": session_id}
 
 
 if __name__ == "__main__":
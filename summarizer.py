@@ -0,0 +1,268 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from src.chunk_store import iter_documents
+from src.context import get_token_counter, overlap_length
+from src.metrics import span
+
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "cache/summaries.sqlite")
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "2000"))
+SUMMARY_REDUCE_TOKENS = int(os.getenv("SUMMARY_REDUCE_TOKENS", "3000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+PROMPT_VERSION = "1"
+
+MAP_PROMPT = """Summarize this section of a document in a few clear bullet points.
+Keep parties, amounts, dates, obligations and termination terms exactly as written.
+
+{text}
+
+Summary:"""
+
+REDUCE_PROMPT = """Combine these partial summaries of one document into a single summary in simple clear points.
+Merge duplicates and keep the most important terms.
+
+{text}
+
+Summary:"""
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SummaryStore:
+
+    def __init__(self, path: str = SUMMARY_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, summary TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, summary FROM summaries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, items: Dict[str, str], kind: str):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                [(key, kind, summary, now) for key, summary in items.items()]
+            )
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self.conn.execute("SELECT kind, COUNT(*) FROM summaries GROUP BY kind").fetchall()
+        return {"path": self.path, **{kind: count for kind, count in rows}}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_summary_store() -> SummaryStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SummaryStore()
+    return _store
+
+
+class Summarizer:
+    # Map: every section is summarised on its own, keyed by a hash of its
+    # text, so a revised document only re-summarises the sections that
+    # changed. Reduce: summaries are merged in groups that fit the budget
+    # until one is left. Every level is persisted by content hash.
+
+    def __init__(self, llm, store: Optional[SummaryStore] = None, section_tokens: int = SUMMARY_SECTION_TOKENS,
+                 reduce_tokens: int = SUMMARY_REDUCE_TOKENS, max_concurrency: int = SUMMARY_CONCURRENCY):
+        self.llm = llm
+        self.store = store or get_summary_store()
+        self.section_tokens = section_tokens
+        self.reduce_tokens = reduce_tokens
+        self.max_concurrency = max_concurrency
+        self.counter = get_token_counter()
+        self.model = getattr(llm, "model_name", type(llm).__name__)
+
+    @staticmethod
+    def _pages(vectorstore) -> Iterator[Tuple[Any, List[str]]]:
+        # Consecutive chunks of one page; chunks without a page stand alone.
+        key, texts = None, []
+        for doc_id, doc in iter_documents(vectorstore):
+            page = doc.metadata.get("page")
+            next_key = (doc.metadata.get("source"), page if page is not None else doc_id)
+            if texts and next_key != key:
+                yield key[0], texts
+                texts = []
+            key = next_key
+            texts.append(doc.page_content)
+        if texts:
+            yield key[0], texts
+
+    def _closes_section(self, last_chunk: str, page_tokens: int) -> bool:
+        fraction = int(content_hash(last_chunk)[:8], 16) / 0xFFFFFFFF
+        return fraction < page_tokens / self.section_tokens
+
+    def sections(self, vectorstore) -> List[str]:
+        # Boundaries are content-defined rather than packed by running total:
+        # a section closes after a page whose last chunk hashes below its share
+        # of section_tokens, so sections average section_tokens and each cut
+        # depends on one page only. An edit re-summarises the sections it
+        # touches and later boundaries stay put. The last chunk is used because
+        # it is the one least affected by the chunk carried in from the
+        # previous page. A section is also closed at 2 * section_tokens and at
+        # the end of each source.
+        sections = []
+        current, tokens, source = [], 0, None
+        for page_source, texts in self._pages(vectorstore):
+            if current and page_source != source:
+                sections.append(" ".join(current))
+                current, tokens = [], 0
+            source = page_source
+
+            page_tokens = 0
+            for text in texts:
+                if current:
+                    text = text[overlap_length(current[-1], text, 400):]
+                count = self.counter.count(text)
+                if current and tokens + count > 2 * self.section_tokens:
+                    sections.append(" ".join(current))
+                    current, tokens = [], 0
+                current.append(text)
+                tokens += count
+                page_tokens += count
+
+            if self._closes_section(texts[-1], page_tokens):
+                sections.append(" ".join(current))
+                current, tokens = [], 0
+        if current:
+            sections.append(" ".join(current))
+        return sections
+
+    def _key(self, kind: str, text: str) -> str:
+        return content_hash(PROMPT_VERSION, self.model, kind, text)
+
+    def _run(self, kind: str, prompt: str, texts: List[str]) -> Tuple[List[str], int]:
+        keys = [self._key(kind, text) for text in texts]
+        cached = self.store.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+
+        if missing:
+            with span(f"summary_{kind}"):
+                responses = self.llm.batch(
+                    [prompt.format(text=text) for text in missing.values()],
+                    config={"max_concurrency": self.max_concurrency}
+                )
+            computed = {key: response.content.strip() for key, response in zip(missing, responses)}
+            self.store.put_many(computed, kind)
+            cached.update(computed)
+
+        return [cached[key] for key in keys], len(missing)
+
+    def _groups(self, summaries: List[str]) -> List[str]:
+        groups, current, tokens = [], [], 0
+        for summary in summaries:
+            count = self.counter.count(summary)
+            if current and tokens + count > self.reduce_tokens:
+                groups.append("\n\n".join(current))
+                current, tokens = [], 0
+            current.append(summary)
+            tokens += count
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+
+    def _stream_one(self, kind: str, prompt: str, text: str) -> Iterator[Dict[str, Any]]:
+        key = self._key(kind, text)
+        cached = self.store.get_many([key]).get(key)
+        if cached is not None:
+            yield {"type": "token", "content": cached}
+            return cached, False
+
+        parts = []
+        with span(f"summary_{kind}"):
+            for chunk in self.llm.stream(prompt.format(text=text)):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"type": "token", "content": chunk.content}
+        summary = "".join(parts).strip()
+        self.store.put_many({key: summary}, kind)
+        return summary, True
+
+    def _groups_for(self, summaries: List[str]) -> List[str]:
+        groups = self._groups(summaries)
+        if len(groups) == len(summaries) > 1:
+            # Each summary alone fills the budget; merge pairs to make progress.
+            groups = ["\n\n".join(summaries[i:i + 2]) for i in range(0, len(summaries), 2)]
+        return groups
+
+    def stream(self, vectorstore) -> Iterator[Dict[str, Any]]:
+        # Map and intermediate reduce steps run as batches; only the last step
+        # is streamed, so its tokens reach the caller as they are generated.
+        start = time.perf_counter()
+        sections = self.sections(vectorstore)
+        result = {"document_hash": None, "sections": len(sections), "sections_computed": 0,
+                  "reduce_levels": 0, "cached": False}
+        if not sections:
+            yield {"type": "done", "summary": "", **result, "elapsed_ms": 0.0}
+            return
+
+        section_keys = [self._key("map", text) for text in sections]
+        result["document_hash"] = document_hash = content_hash(PROMPT_VERSION, self.model, *section_keys)
+
+        final = self.store.get_many([document_hash]).get(document_hash)
+        if final is not None:
+            result["cached"] = True
+            yield {"type": "token", "content": final}
+        elif len(sections) == 1:
+            final, computed = yield from self._stream_one("map", MAP_PROMPT, sections[0])
+            result["sections_computed"] = int(computed)
+        else:
+            summaries, result["sections_computed"] = self._run("map", MAP_PROMPT, sections)
+            yield {"type": "progress", "stage": "map", "done": len(sections), "total": len(sections)}
+
+            groups = self._groups_for(summaries)
+            while len(groups) > 1:
+                summaries, _ = self._run("reduce", REDUCE_PROMPT, groups)
+                result["reduce_levels"] += 1
+                yield {"type": "progress", "stage": "reduce", "level": result["reduce_levels"], "total": len(groups)}
+                groups = self._groups_for(summaries)
+
+            final, _ = yield from self._stream_one("reduce", REDUCE_PROMPT, groups[0])
+            result["reduce_levels"] += 1
+
+        if not result["cached"]:
+            self.store.put_many({document_hash: final}, "document")
+        yield {"type": "done", "summary": final, **result,
+               "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    def summarize(self, vectorstore) -> Dict[str, Any]:
+        for event in self.stream(vectorstore):
+            if event["type"] == "done":
+                return {key: value for key, value in event.items() if key != "type"}
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+
+from src.answer_cache import AnswerCache
+
+
+def test_answer_from_a_replaced_index_is_not_cached():
+    cache = AnswerCache()
+    old_generation = cache.generation("contract")
+
+    cache.invalidate("contract")
+    cache.put("contract", "What is the term?", 4, {"answer": "12 months"}, old_generation)
+    assert cache.get("contract", "What is the term?", 4) is None
+    assert cache.stats()["stale_puts"] == 1
+
+    cache.put("contract", "What is the term?", 4, {"answer": "24 months"}, cache.generation("contract"))
+    assert cache.get("contract", "What is the term?", 4)["answer"] == "24 months"
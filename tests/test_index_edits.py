@@ -0,0 +1,90 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from src.indexing import load_config
+from src.ingestion import DocumentIngestion
+
+DIM = 32
+PER_SOURCE = 200
+
+
+def build_ingestion(index_type: str, storage: str = "float32"):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2 * PER_SOURCE, DIM)).astype(np.float32)
+    sources = ["a.pdf"] * PER_SOURCE + ["b.pdf"] * PER_SOURCE
+    chunk_ids = list(range(PER_SOURCE)) * 2
+    texts = [f"{source} chunk {chunk_id}" for source, chunk_id in zip(sources, chunk_ids)]
+
+    ingestion = DocumentIngestion(embeddings=FakeEmbeddings(size=DIM), use_cache=False, index_type=index_type,
+                                  storage=storage)
+    ingestion.vectorstore = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())),
+        ingestion.embeddings,
+        metadatas=[{"source": s, "chunk_id": c} for s, c in zip(sources, chunk_ids)],
+        ids=[f"{s}:{c}" for s, c in zip(sources, chunk_ids)]
+    )
+    ingestion._convert_index()
+    return ingestion, vectors
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_removing_a_source_keeps_hits_mapped_to_their_chunks(index_type):
+    ingestion, vectors = build_ingestion(index_type)
+    assert ingestion.index_config is None or ingestion.index_config["index_type"] == index_type
+
+    ingestion._delete_ids([f"a.pdf:{i}" for i in range(PER_SOURCE)])
+    vectorstore = ingestion.vectorstore
+    assert vectorstore.index.ntotal == PER_SOURCE
+    assert sorted(vectorstore.index_to_docstore_id) == list(range(PER_SOURCE))
+
+    for chunk_id in range(0, PER_SOURCE, 10):
+        doc, _ = vectorstore.similarity_search_with_score_by_vector(
+            vectors[PER_SOURCE + chunk_id].tolist(), k=1
+        )[0]
+        assert doc.metadata == {"source": "b.pdf", "chunk_id": chunk_id}
+
+
+def test_edits_update_saved_chunks_and_bm25_in_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ingestion, vectors = build_ingestion("flat")
+    ingestion.save_vectorstore("contracts")
+
+    ingestion.vectorstore = ingestion.load_vectorstore("contracts", mmap=False)
+    ingestion._delete_ids([f"a.pdf:{i}" for i in range(PER_SOURCE)])
+    ingestion.vectorstore.add_embeddings(
+        [("c.pdf chunk 0 indemnity", vectors[0].tolist())],
+        metadatas=[{"source": "c.pdf", "chunk_id": 0}],
+        ids=["c.pdf:0"]
+    )
+    ingestion.save_vectorstore("contracts")
+
+    loaded = ingestion.load_vectorstore("contracts")
+    assert loaded.index.ntotal == PER_SOURCE + 1
+    assert loaded.docstore.sources() == ["b.pdf", "c.pdf"]
+    assert loaded.index_to_docstore_id[PER_SOURCE] == "c.pdf:0"
+    doc, _ = loaded.similarity_search_with_score_by_vector(vectors[0].tolist(), k=1)[0]
+    assert doc.metadata == {"source": "c.pdf", "chunk_id": 0}
+    assert len(loaded.lexical_index) == PER_SOURCE + 1
+    assert loaded.lexical_index.search("indemnity", k=1)[0][0] == "c.pdf:0"
+
+
+def test_resaving_as_flat_float32_drops_the_old_index_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ingestion, _ = build_ingestion("flat", storage="sq8")
+    ingestion.save_vectorstore("contracts")
+    assert load_config("vectorstore/contracts")["storage"] == "sq8"
+
+    ingestion, vectors = build_ingestion("flat")
+    ingestion.save_vectorstore("contracts")
+    assert load_config("vectorstore/contracts") is None
+
+    loaded = ingestion.load_vectorstore("contracts")
+    assert ingestion.index_config is None
+    assert loaded.exact_vectors is None
+    doc, _ = loaded.similarity_search_with_score_by_vector(vectors[0].tolist(), k=1)[0]
+    assert doc.metadata == {"source": "a.pdf", "chunk_id": 0}
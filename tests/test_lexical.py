@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from src.lexical import BM25Index, BM25Store
+
+DOCS = [
+    ("a:0", "Section 7.2 payment terms are net thirty days"),
+    ("a:1", "Either party may terminate for convenience upon notice"),
+    ("a:2", "Acme Holdings shall pay all fees"),
+    ("a:3", "This agreement is governed by the law of England")
+]
+
+
+def rounded(hits):
+    return [(doc_id, round(score, 9)) for doc_id, score in hits]
+
+
+def test_store_add_and_update_match_a_rebuilt_index(tmp_path):
+    BM25Index.from_documents(DOCS).save(str(tmp_path))
+    store = BM25Index.load(str(tmp_path))
+    assert isinstance(store, BM25Store)
+
+    store.add("b:0", "Acme Holdings caps its indemnity at the fees paid")
+    store.add("a:1", "Either party may terminate for material breach")
+    store.update([], ["a:3"])
+
+    expected = BM25Index.from_documents([
+        DOCS[0], DOCS[2], ("b:0", "Acme Holdings caps its indemnity at the fees paid"),
+        ("a:1", "Either party may terminate for material breach")
+    ])
+    assert len(store) == len(expected) == 4
+    for query in ["payment terms", "Acme Holdings", "terminate breach", "indemnity", "England"]:
+        assert rounded(store.search(query)) == rounded(expected.search(query))
+    assert len(BM25Index.load(str(tmp_path))) == 4
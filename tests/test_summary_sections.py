@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from src.summarizer import SummaryStore, Summarizer, content_hash
+
+WORDS = ["party", "shall", "pay", "notice", "term", "agreement", "invoice", "days", "liability", "confidential"]
+
+
+class Pages:
+
+    def __init__(self, pages):
+        docs = {}
+        for page, chunks in enumerate(pages, 1):
+            for text in chunks:
+                docs[f"c{len(docs)}"] = Document(page_content=text, metadata={"source": "a.pdf", "page": page})
+        self.docstore = InMemoryDocstore(docs)
+        self.index_to_docstore_id = dict(enumerate(docs))
+
+
+def make_pages(num_pages: int = 60, chunks_per_page: int = 3):
+    rng = random.Random(0)
+    return [
+        [f"Page {page} clause {i}: " + " ".join(rng.choice(WORDS) for _ in range(30)) for i in range(chunks_per_page)]
+        for page in range(1, num_pages + 1)
+    ]
+
+
+def test_editing_page_one_keeps_later_sections(tmp_path):
+    summarizer = Summarizer(None, store=SummaryStore(str(tmp_path / "summaries.sqlite")), section_tokens=1000)
+    pages = make_pages()
+    before = summarizer.sections(Pages(pages))
+
+    pages[0][0] += " Amendment: the supplier shall pay a revised fee of $75,000 within 45 days." * 8
+    after = summarizer.sections(Pages(pages))
+
+    # Only the section holding page 1 changes (it may split in two once it
+    # outgrows the cap); every later section keeps its text and so its hash.
+    assert len(before) > 5
+    unchanged = before[1:]
+    assert [content_hash(text) for text in after[-len(unchanged):]] == [content_hash(text) for text in unchanged]
+    assert len(after) - len(unchanged) <= 2
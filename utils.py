@@ -58,14 +58,6 @@ def format_chat_history(history: List[Dict]) -> str:
     return formatted
 
 
-def save_log(message: str, log_file: str = "logs/app.log"):
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(f"[{timestamp}] {message}\n")
-
-
 def create_directories():
-    for directory in ["data", "vectorstore", "logs"]:
+    for directory in ["data", "vectorstore", "logs", "cache"]:
         os.makedirs(directory, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+
+class Warmup:
+
+    def __init__(self):
+        self.steps = []
+        self.status = "pending"
+        self.current = None
+        self.completed = {}
+        self.errors = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def add(self, name: str, fn: Callable[[], Any], required: bool = True):
+        self.steps.append((name, fn, required))
+
+    def start(self) -> threading.Thread:
+        self.status = "warming"
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        failed = False
+        for name, fn, required in self.steps:
+            self.current = name
+            start = time.perf_counter()
+            try:
+                fn()
+                self.completed[name] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                self.errors[name] = str(e)
+                failed = failed or required
+        self.current = None
+        self.finished_at = time.time()
+        self.status = "failed" if failed else "ready"
+
+    def wait(self, timeout: float = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.is_ready()
+
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def pending(self) -> List[str]:
+        return [name for name, _, _ in self.steps if name not in self.completed and name not in self.errors]
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "status": self.status,
+            "current_step": self.current,
+            "step_seconds": dict(self.completed),
+            "pending": self.pending(),
+            "errors": dict(self.errors),
+            "elapsed_s": elapsed
+        }